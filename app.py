@@ -3,12 +3,13 @@ import json
 import streamlit as st
 import sqlite3
 
-from backend.metadata_extractor import extract_metadata
+from backend.config import METADATA_DIR
+from backend.db_connector import instrument_connection
+from backend.metadata_extractor import extract_metadata, catalog_version, changes_since
 from backend.quality_engine import analyze_quality
 from backend.ai_summarizer import generate_table_summary
 
 BASE_DIR = os.path.dirname(__file__)
-METADATA_DIR = os.path.join(BASE_DIR, "metadata")
 AI_DOCS_DIR = os.path.join(BASE_DIR, "ai_docs")
 DB_PATH = os.path.join(BASE_DIR, "datadoc_demo.db")
 
@@ -58,7 +59,8 @@ def add_hint_question(q):
 # ----------------- DIRECT DB QUERY HELPERS -----------------
 
 def run_query(sql, params=()):
-    conn = sqlite3.connect(DB_PATH)
+    # Shows up in the query log when DB_QUERY_LOG=1
+    conn = instrument_connection(sqlite3.connect(DB_PATH))
     cur = conn.cursor()
     cur.execute(sql, params)
     rows = cur.fetchall()
@@ -212,9 +214,16 @@ with st.sidebar:
 
     if st.button("🔄 Refresh Metadata & Quality"):
         with st.spinner("Re-extracting metadata and recomputing quality..."):
+            version_before = catalog_version()
             extract_metadata()
-            analyze_quality()
-        st.success("✅ Refreshed successfully!")
+            _, quality_errors = analyze_quality()
+        if quality_errors:
+            st.warning(f"⚠️ Quality analysis skipped: {', '.join(sorted(quality_errors))}")
+        changed = [c["table"] for c in changes_since(version_before)["changes"]]
+        if changed:
+            st.success(f"✅ Refreshed successfully! Schema changed for: {', '.join(changed)}")
+        else:
+            st.success("✅ Refreshed successfully! No schema changes.")
 
     st.divider()
 
@@ -384,7 +393,7 @@ if user_query:
                     answer = "Please mention a valid table (customers, orders, or payments)."
 
             elif "quality" in q or "null" in q or "missing" in q:
-                results = analyze_quality()
+                results, errors = analyze_quality()
                 answer = "📊 **Latest Data Quality Summary:**\n\n"
                 for table, ql in results.items():
                     worst_col = min(
@@ -396,6 +405,8 @@ if user_query:
                         f"Worst column: `{worst_col[0]}` "
                         f"({worst_col[1]['completeness_percent']}% complete)\n"
                     )
+                for table, error in sorted(errors.items()):
+                    answer += f"**{table}** → ⚠️ skipped: {error}\n"
 
             elif "related" in q or "lineage" in q:
                 rel = get_relationships()
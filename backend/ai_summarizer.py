@@ -1,94 +1,530 @@
 import os
 import json
-from groq import Groq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backend.config import METADATA_DIR
+from backend.metrics import (
+    LLM_LATENCY, LLM_REQUESTS, LLM_TIME_TO_FIRST_TOKEN, LLM_TOKENS, SUMMARY_CACHE_LOOKUPS, SUMMARY_COALESCED,
+    SUMMARY_WAIT_TIMEOUTS
+)
+from backend.single_flight import SingleFlight
+from backend.summary_cache import get_summary, put_summary, summary_key
 
 # -----------------------------
 # PATHS (your existing structure)
 # -----------------------------
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-METADATA_DIR = os.path.join(BASE_DIR, "metadata")
 AI_DOCS_DIR = os.path.join(BASE_DIR, "ai_docs")
 
-# Ensure ai_docs folder exists
-os.makedirs(AI_DOCS_DIR, exist_ok=True)
-
 # -----------------------------
-# INITIALIZE GROQ CLIENT (SAFE WAY)
+# GROQ CLIENT (created on first use)
 # -----------------------------
 # 🔹 Put your key in an environment variable instead of hard-coding it
 # In PowerShell run once:
 # setx GROQ_API_KEY "your_real_key_here"
+#
+# The groq SDK is slow to import, so it is only loaded when the first
+# summary is requested; importing this module stays cheap on cold starts.
 
-# Initialize Groq client safely
-api_key = os.getenv("GROQ_API_KEY")
-if api_key:
-    client = Groq(api_key=api_key)
-else:
-    client = None
-    print("⚠️ GROQ_API_KEY not found. AI summaries will be disabled.")
+_client = None
+_client_lock = threading.Lock()
+_missing_key_warned = False
 
 
-def load_json(path):
-    with open(path, "r") as f:
-        return json.load(f)
+def llm_configured():
+    return bool(os.getenv("GROQ_API_KEY"))
 
-def generate_table_summary(table_name):
-    if not client:
-        return f"🤖 AI summaries are disabled. Please set GROQ_API_KEY environment variable to enable AI-powered table summaries for {table_name}."
-    
-    # Load metadata and quality files
-    meta_path = os.path.join(METADATA_DIR, f"{table_name}.json")
-    quality_path = os.path.join(METADATA_DIR, f"{table_name}_quality.json")
 
-    metadata = load_json(meta_path)
-    quality = load_json(quality_path)
+def get_client():
+    """Shared Groq client, or None when GROQ_API_KEY is not set"""
+    global _client
+    if _client is None and llm_configured():
+        with _client_lock:
+            if _client is None:
+                from groq import Groq
+                _client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _client
 
-    prompt = f"""
-You are a data documentation assistant.
 
-Here is technical metadata for table: {table_name}
-Columns: {metadata['columns']}
-Primary Keys: {metadata['primary_keys']}
+def warn_missing_key():
+    """Print the missing GROQ_API_KEY warning once per process, not on every request"""
+    global _missing_key_warned
+    if not _missing_key_warned:
+        _missing_key_warned = True
+        print("⚠️ GROQ_API_KEY not found. AI summaries will be disabled.")
+
+
+def new_async_client():
+    """
+    A new AsyncGroq client for one batch run, or None when GROQ_API_KEY is not set.
+
+    Its connections belong to the event loop that first uses it, so it is
+    not shared between runs; close it (async with client:) when done.
+    """
+    if not llm_configured():
+        return None
+    from groq import AsyncGroq
+    # Retries are handled by the caller (backend/batch_summaries.py)
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+
+
+MODEL = "llama-3.1-8b-instant"   # Active Groq model
+
+
+def _record_completion(model, start, ok=True, usage=None):
+    LLM_LATENCY.observe(time.perf_counter() - start, model)
+    LLM_REQUESTS.inc(model, "ok" if ok else "error")
+    if usage is not None:
+        LLM_TOKENS.inc(model, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+        LLM_TOKENS.inc(model, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
 
-Here is data quality information:
-{quality}
+def create_completion(model=MODEL, **kwargs):
+    """client.chat.completions.create() with latency and token usage recorded in backend.metrics"""
+    start = time.perf_counter()
+    try:
+        response = get_client().chat.completions.create(model=model, **kwargs)
+    except Exception:
+        _record_completion(model, start, ok=False)
+        raise
+    _record_completion(model, start, usage=getattr(response, "usage", None))
+    return response
 
-Generate:
+
+async def create_completion_async(client, model=MODEL, **kwargs):
+    """create_completion() on an async client from new_async_client()"""
+    start = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(model=model, **kwargs)
+    except Exception:
+        _record_completion(model, start, ok=False)
+        raise
+    _record_completion(model, start, usage=getattr(response, "usage", None))
+    return response
+
+
+def load_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+# Bump PROMPT_VERSION whenever the templates below change so cached
+# summaries written with the old prompts are not reused.
+PROMPT_VERSION = 2
+TEMPERATURE = 0.3
+
+# Tables whose prompt would exceed this many (estimated) tokens are
+# summarized map-reduce style: column groups first, then a merge.
+PROMPT_TOKEN_BUDGET = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", "4000"))
+MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+# Completion cap for each column-group note
+PARTIAL_MAX_TOKENS = 400
+
+INSTRUCTIONS = """Generate:
 1) A clear business-friendly summary of what this table represents.
 2) Key columns and their likely business meaning.
 3) Any data quality risks or caveats.
 4) How analysts should typically use this table.
 
-Write this in clean, readable Markdown with headings and bullet points.
+Write this in clean, readable Markdown with headings and bullet points."""
+
+PROMPT_TEMPLATE = """
+You are a data documentation assistant.
+
+Table: {table_name}
+Primary keys: {primary_keys}
+Data quality: {quality}
+
+Columns (name, type, flags, % non-null, stats):
+{columns}
+
+{instructions}
 """
 
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",   # Active Groq model
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3
+MAP_TEMPLATE = """
+You are a data documentation assistant. Table {table_name} has too many columns to document at once; these are columns {part} of {parts}.
+
+Table data quality: {quality}
+
+Columns (name, type, flags, % non-null, stats):
+{columns}
+
+For each column, give its likely business meaning in a few words. Then list any data quality risks in these columns. Reply with concise Markdown bullet points only.
+"""
+
+REDUCE_TEMPLATE = """
+You are a data documentation assistant.
+
+Table: {table_name} ({column_count} columns)
+Primary keys: {primary_keys}
+Data quality: {quality}
+
+Notes on the table's columns, written group by group:
+{notes}
+
+{instructions}
+Under key columns, pick the most important ones rather than listing every column.
+"""
+
+CONDENSE_TEMPLATE = """
+You are a data documentation assistant. Condense these notes on the columns of table {table_name} into one shorter list of Markdown bullet points. Keep the most important columns and every data quality risk.
+
+{notes}
+"""
+
+# Refresh bookkeeping that changes on every run without changing the data
+VOLATILE_QUALITY_KEYS = ("profiled_at", "watermark", "refresh")
+
+
+def prompt_inputs(table_name):
+    """Everything from the metadata / quality files that goes into the prompt"""
+    metadata = load_json(os.path.join(METADATA_DIR, f"{table_name}.json"))
+    quality = load_json(os.path.join(METADATA_DIR, f"{table_name}_quality.json"))
+    return {
+        "table_name": table_name,
+        "columns": metadata["columns"],
+        "primary_keys": metadata["primary_keys"],
+        "quality": {key: value for key, value in quality.items() if key not in VOLATILE_QUALITY_KEYS}
+    }
+
+
+def cache_key(inputs):
+    """Summary cache key: prompt inputs plus every setting that changes the generated text"""
+    return summary_key(inputs, MODEL, f"{PROMPT_VERSION}:{PROMPT_TOKEN_BUDGET}", TEMPERATURE)
+
+
+# -----------------------------
+# PROMPT BUILDING (token budget / map-reduce)
+# -----------------------------
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def column_lines(inputs):
+    """One compact line per column, with its completeness and (if profiled) sketch statistics"""
+    primary_keys = set(inputs["primary_keys"])
+    completeness = inputs["quality"].get("column_completeness") or {}
+    statistics = inputs["quality"].get("column_statistics") or {}
+
+    lines = []
+    for column in inputs["columns"]:
+        name = column["column_name"]
+        parts = [name, column.get("data_type") or "?"]
+        if name in primary_keys:
+            parts.append("PK")
+        if column.get("not_null"):
+            parts.append("NOT NULL")
+        filled = (completeness.get(name) or {}).get("completeness_percent")
+        if filled is not None:
+            parts.append(f"{filled:g}% non-null")
+        stats = statistics.get(name) or {}
+        if stats.get("distinct_estimate") is not None:
+            parts.append(f"~{stats['distinct_estimate']} distinct")
+        if stats.get("min") is not None:
+            parts.append(f"range {stats['min']} .. {stats['max']}")
+        lines.append("- " + ", ".join(str(part) for part in parts))
+    return lines
+
+
+def compact_quality(quality):
+    """Table-level quality facts as `key: value` pairs (per-column figures are on the column lines)"""
+    return "; ".join(
+        f"{key}: {json.dumps(value, separators=(',', ':'), default=str)}"
+        for key, value in quality.items()
+        if key not in ("column_completeness", "column_statistics")
     )
 
-    summary = response.choices[0].message.content
 
-    # Save as Markdown
+def _pack(items, room):
+    """Split items into consecutive groups whose estimated tokens fit `room` (at least one item each)"""
+    groups, group, used = [], [], 0
+    for item in items:
+        cost = estimate_tokens(item) + 1
+        if group and used + cost > room:
+            groups.append(group)
+            group, used = [], 0
+        group.append(item)
+        used += cost
+    if group:
+        groups.append(group)
+    return groups
+
+
+def summary_prompts(inputs):
+    """
+    ("single", prompt) when the whole table fits PROMPT_TOKEN_BUDGET, else
+    ("map", [prompt per column group]) - the map step of map-reduce.
+    """
+    fields = {
+        "table_name": inputs["table_name"],
+        "primary_keys": ", ".join(inputs["primary_keys"]) or "none",
+        "quality": compact_quality(inputs["quality"]),
+        "instructions": INSTRUCTIONS
+    }
+    lines = column_lines(inputs)
+    prompt = PROMPT_TEMPLATE.format(columns="\n".join(lines), **fields)
+    if estimate_tokens(prompt) <= PROMPT_TOKEN_BUDGET:
+        return "single", prompt
+
+    room = PROMPT_TOKEN_BUDGET - estimate_tokens(MAP_TEMPLATE.format(part="00", parts="00", columns="", **fields))
+    groups = _pack(lines, room)
+    return "map", [
+        MAP_TEMPLATE.format(part=i + 1, parts=len(groups), columns="\n".join(group), **fields)
+        for i, group in enumerate(groups)
+    ]
+
+
+def merge_prompts(inputs, notes):
+    """
+    Reduce step over column-group notes: ("final", prompt) if they fit the
+    budget together, else ("condense", [prompt per group of notes]) to
+    shrink them first.
+    """
+    fields = {
+        "table_name": inputs["table_name"],
+        "column_count": len(inputs["columns"]),
+        "primary_keys": ", ".join(inputs["primary_keys"]) or "none",
+        "quality": compact_quality(inputs["quality"]),
+        "instructions": INSTRUCTIONS
+    }
+    prompt = REDUCE_TEMPLATE.format(notes="\n\n".join(notes), **fields)
+    if estimate_tokens(prompt) <= PROMPT_TOKEN_BUDGET or len(notes) == 1:
+        return "final", prompt
+
+    room = PROMPT_TOKEN_BUDGET - estimate_tokens(CONDENSE_TEMPLATE.format(table_name=inputs["table_name"], notes=""))
+    groups = _pack(notes, room)
+    if len(groups) == len(notes):
+        # Notes too long to combine within the budget: pair them up so every round halves the count
+        groups = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+    return "condense", [
+        CONDENSE_TEMPLATE.format(table_name=inputs["table_name"], notes="\n\n".join(group)) for group in groups
+    ]
+
+
+def final_prompt(inputs, complete_all):
+    """
+    The prompt that produces the finished summary. For tables over the
+    budget this runs the map (and any condense) rounds first through
+    complete_all(prompts) -> texts.
+    """
+    kind, prompts = summary_prompts(inputs)
+    if kind == "single":
+        return prompts
+    notes = complete_all(prompts)
+    while True:
+        kind, prompts = merge_prompts(inputs, notes)
+        if kind == "final":
+            return prompts
+        notes = complete_all(prompts)
+
+
+def _complete_text(prompt, max_tokens=None):
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    response = create_completion(
+        model=MODEL, messages=[{"role": "user", "content": prompt}], temperature=TEMPERATURE, **options
+    )
+    return response.choices[0].message.content
+
+
+def _complete_notes(prompts):
+    """Column-group notes, MAP_CONCURRENCY completions at a time"""
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix="summary-map") as executor:
+        return list(executor.map(lambda prompt: _complete_text(prompt, PARTIAL_MAX_TOKENS), prompts))
+
+
+def save_summary(table_name, summary):
+    os.makedirs(AI_DOCS_DIR, exist_ok=True)
     md_path = os.path.join(AI_DOCS_DIR, f"{table_name}.md")
     with open(md_path, "w", encoding="utf-8") as f:
         f.write(summary)
 
+
+# Concurrent requests for the same summary (same cache key) share one
+# generation; the others wait up to SUMMARY_WAIT_TIMEOUT seconds for it.
+SUMMARY_WAIT_TIMEOUT = float(os.getenv("SUMMARY_WAIT_TIMEOUT", "120"))
+_in_flight = SingleFlight()
+
+
+def summaries_in_flight():
+    return _in_flight.in_flight()
+
+
+def _wait_for_shared(call, wait_timeout):
+    SUMMARY_COALESCED.inc()
+    try:
+        return call.wait(SUMMARY_WAIT_TIMEOUT if wait_timeout is None else wait_timeout)
+    except TimeoutError:
+        SUMMARY_WAIT_TIMEOUTS.inc()
+        raise
+
+
+def _claim_summary(table_name, key, use_cache, wait_timeout):
+    """
+    Cache lookup and single-flight shared by summarize_table and stream_table_summary.
+
+    Returns (summary, info, call): a cached or shared summary with call=None;
+    summary=None with the call this request now leads (finish it once the LLM
+    answers); or (None, None, None) when no LLM client is configured.
+    """
+    summary = get_summary(key) if use_cache else None
+    if use_cache:
+        SUMMARY_CACHE_LOOKUPS.inc("hit" if summary is not None else "miss")
+
+    if summary is None:
+        if not get_client():
+            return None, None, None
+
+        call, leader = _in_flight.begin(key)
+        if not leader:
+            summary = _wait_for_shared(call, wait_timeout)
+            return summary, {"cached": False, "shared": True, "cache_key": key, "model": MODEL}, None
+
+        # An identical generation may have finished between the cache check and begin()
+        summary = get_summary(key) if use_cache else None
+        if summary is None:
+            return None, {"cached": False, "shared": False, "cache_key": key, "model": MODEL}, call
+        _in_flight.finish(key, call, result=summary)
+
+    save_summary(table_name, summary)
+    return summary, {"cached": True, "shared": False, "cache_key": key, "model": MODEL}, None
+
+
+def summarize_table(table_name, use_cache=True, wait_timeout=None):
+    """
+    {"summary", "cached", "shared", "cache_key", "model"} for a table.
+    Summaries are reused while the prompt inputs and generation settings (see
+    cache_key) are unchanged; use_cache=False always calls the LLM (and
+    refreshes the cache). Tables over PROMPT_TOKEN_BUDGET are summarized
+    map-reduce style.
+
+    shared=True means an identical generation was already running and this
+    call waited for its result; TimeoutError if that took over wait_timeout
+    seconds (default SUMMARY_WAIT_TIMEOUT).
+    """
+    inputs = prompt_inputs(table_name)
+    key = cache_key(inputs)
+
+    summary, info, call = _claim_summary(table_name, key, use_cache, wait_timeout)
+    if info is None:
+        warn_missing_key()
+        return {
+            "summary": f"🤖 AI summaries are disabled. Please set GROQ_API_KEY environment variable to enable AI-powered table summaries for {table_name}.",
+            "cached": False, "shared": False, "cache_key": None, "model": None
+        }
+    if summary is not None:
+        return {"summary": summary, **info}
+
+    try:
+        summary = _complete_text(final_prompt(inputs, _complete_notes))
+        put_summary(key, summary)
+        save_summary(table_name, summary)
+    except Exception as e:
+        _in_flight.finish(key, call, error=e)
+        raise
+    _in_flight.finish(key, call, result=summary)
+
     print(f"✅ AI summary generated for {table_name}")
-    return summary
+    return {"summary": summary, **info}
 
-def generate_all_summaries():
-    tables = [
+
+def stream_table_summary(table_name, use_cache=True, wait_timeout=None):
+    """
+    summarize_table() as a stream of (event, data) pairs for progressive rendering:
+        ("meta", {"cached", "shared", "cache_key", "model"}) first,
+        ("delta", text) for each piece of the summary as the LLM produces it,
+        ("done", {"cached", "shared", "cache_key", "model"}) once the full text is saved.
+    A cached summary, or one shared with an identical generation already in
+    progress, arrives as a single delta. Nothing is saved if the consumer
+    stops reading before the end.
+    """
+    inputs = prompt_inputs(table_name)
+    key = cache_key(inputs)
+
+    summary, info, call = _claim_summary(table_name, key, use_cache, wait_timeout)
+    if info is None:
+        raise RuntimeError("AI summaries are disabled. Set GROQ_API_KEY to enable them.")
+    if summary is not None:
+        yield "meta", info
+        yield "delta", summary
+        yield "done", info
+        return
+
+    try:
+        yield "meta", info
+        summary = yield from _stream_completion(inputs)
+        put_summary(key, summary)
+        save_summary(table_name, summary)
+    except GeneratorExit:
+        _in_flight.finish(key, call, error=RuntimeError("The summary stream this request was waiting on was closed"))
+        raise
+    except Exception as e:
+        _in_flight.finish(key, call, error=e)
+        raise
+    _in_flight.finish(key, call, result=summary)
+
+    print(f"✅ AI summary streamed for {table_name}")
+    yield "done", info
+
+
+def _stream_completion(inputs):
+    """Yield ("delta", text) events for a streamed summary; returns the full text"""
+    start = time.perf_counter()
+    parts = []
+    usage = None
+    try:
+        # Very wide tables run their map step first; the final merge is streamed
+        prompt = final_prompt(inputs, _complete_notes)
+        stream = get_client().chat.completions.create(
+            model=MODEL, messages=[{"role": "user", "content": prompt}], temperature=TEMPERATURE, stream=True
+        )
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts:
+                        LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - start, MODEL)
+                    parts.append(delta)
+                    yield "delta", delta
+                # Groq reports token usage on the last chunk of a stream
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+        finally:
+            # Also runs when the consumer disconnects mid-stream
+            if hasattr(stream, "close"):
+                stream.close()
+    except Exception:
+        _record_completion(MODEL, start, ok=False)
+        raise
+    _record_completion(MODEL, start, usage=usage)
+    return "".join(parts)
+
+
+def generate_table_summary(table_name):
+    return summarize_table(table_name)["summary"]
+
+def documented_tables():
+    """Tables with extracted metadata (one <table>.json per table in METADATA_DIR)"""
+    return sorted(
         f.replace(".json", "")
         for f in os.listdir(METADATA_DIR)
         if f.endswith(".json") and not f.endswith("_quality.json")
-    ]
+    )
 
-    summaries = {}
 
-    for table in tables:
-        summaries[table] = generate_table_summary(table)
+def generate_all_summaries():
+    """Summaries for every table, generated concurrently (see backend/batch_summaries.py)"""
+    tables = documented_tables()
+    if not llm_configured():
+        return {table: generate_table_summary(table) for table in tables}
+
+    from backend.batch_summaries import generate_summaries
+    results, errors = generate_summaries(tables)
+
+    summaries = {}
+    for table in results:
+        with open(os.path.join(AI_DOCS_DIR, f"{table}.md"), "r", encoding="utf-8") as f:
+            summaries[table] = f.read()
 
-    print("✅ AI summaries generated for all tables.")
+    print(f"✅ AI summaries generated for {len(results)} tables ({len(errors)} failed).")
     return summaries
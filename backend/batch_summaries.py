@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import random
+import time
+from backend.ai_summarizer import (
+    AI_DOCS_DIR, MODEL, PARTIAL_MAX_TOKENS, TEMPERATURE, METADATA_DIR, cache_key, create_completion_async,
+    documented_tables, estimate_tokens, merge_prompts, new_async_client, prompt_inputs, save_summary,
+    summary_prompts
+)
+from backend.summary_cache import get_summary, put_summary
+
+# -----------------------------
+# BATCH SUMMARY GENERATION
+# -----------------------------
+# Documents many tables at once on the async Groq client: a bounded number
+# of requests in flight, token buckets that keep the run under the account's
+# requests/minute and tokens/minute limits, and jittered exponential backoff
+# on 429 / 5xx / connection errors. Every finished table is appended to a
+# checkpoint file, so rerunning an interrupted batch skips tables whose
+# prompt inputs have not changed since they were documented (and whose
+# ai_docs/<table>.md is still there).
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# Budgeted for the completion before the real usage is known
+COMPLETION_TOKEN_ESTIMATE = 700
+
+CHECKPOINT_PATH = os.getenv(
+    "SUMMARY_CHECKPOINT_PATH", os.path.join(METADATA_DIR, "cache", "summary_checkpoint.jsonl")
+)
+
+
+class TokenBucket:
+    """Refills per_minute units per minute (0 = unlimited); acquire() waits until enough are available"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        if self.rate <= 0:
+            return
+        # A single request larger than the whole bucket still has to run eventually
+        amount = min(amount, self.capacity)
+        async with self._lock:  # first come, first served
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount):
+        """Give back (or, if negative, charge) units once a request's real cost is known"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retrying after `error`, or None if it should not be retried"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # Connection drops and timeouts (groq.APIConnectionError / APITimeoutError)
+        name = type(error).__name__
+        if not isinstance(error, (ConnectionError, asyncio.TimeoutError)) and "Connection" not in name and "Timeout" not in name:
+            return None
+    elif status != 429 and status < 500:
+        return None
+
+    # Full jitter, so workers that failed together don't retry together
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+class Checkpoint:
+    """Append-only JSONL of finished tables ({"table", "cache_key"}); the latest line per table wins"""
+
+    def __init__(self, path=CHECKPOINT_PATH, resume=True):
+        self.path = path
+        self.done = {}
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted run
+                    self.done[entry["table"]] = entry["cache_key"]
+
+        # Start from a compacted file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for table, key in self.done.items():
+                f.write(json.dumps({"table": table, "cache_key": key}) + "\n")
+        os.replace(tmp_path, path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def finished(self, table, key):
+        return self.done.get(table) == key
+
+    def record(self, table, key):
+        self.done[table] = key
+        self._file.write(json.dumps({"table": table, "cache_key": key}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class _Limits:
+    """What every completion in a batch shares: the client, the in-flight cap and both rate limits"""
+
+    def __init__(self, client, concurrency, requests_per_minute, tokens_per_minute):
+        self.client = client
+        self.in_flight = asyncio.Semaphore(max(1, int(concurrency)))
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+
+async def _complete(prompt, limits, table, max_tokens=None):
+    """One rate-limited completion with retries; returns its text"""
+    estimate = estimate_tokens(prompt) + (max_tokens or COMPLETION_TOKEN_ESTIMATE)
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    for attempt in range(SUMMARY_MAX_RETRIES + 1):
+        await limits.requests.acquire()
+        await limits.tokens.acquire(estimate)
+        try:
+            async with limits.in_flight:
+                response = await create_completion_async(
+                    limits.client, model=MODEL, messages=[{"role": "user", "content": prompt}], temperature=TEMPERATURE, **options
+                )
+            break
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None or attempt == SUMMARY_MAX_RETRIES:
+                raise
+            print(f"⚠️ Summary request for {table} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None):
+        limits.tokens.refund(estimate - usage.total_tokens)
+    return response.choices[0].message.content
+
+
+async def _write_summary(inputs, limits):
+    """ai_summarizer.final_prompt() + completion, with the map / condense rounds run concurrently"""
+    table = inputs["table_name"]
+
+    async def complete_all(prompts):
+        return await asyncio.gather(*(_complete(prompt, limits, table, PARTIAL_MAX_TOKENS) for prompt in prompts))
+
+    kind, prompts = summary_prompts(inputs)
+    if kind == "map":
+        notes = await complete_all(prompts)
+        while True:
+            kind, prompts = merge_prompts(inputs, notes)
+            if kind == "final":
+                break
+            notes = await complete_all(prompts)
+    return await _complete(prompts, limits, table)
+
+
+async def _summarize(table, checkpoint, limits, use_cache):
+    """Document one table; returns "checkpoint", "cache" or "llm" (where the summary came from)"""
+    inputs = prompt_inputs(table)
+    key = cache_key(inputs)
+    # A checkpointed table whose doc was deleted is rewritten (from the cache if possible)
+    if use_cache and checkpoint.finished(table, key) and os.path.exists(os.path.join(AI_DOCS_DIR, f"{table}.md")):
+        return "checkpoint"
+
+    summary = get_summary(key) if use_cache else None
+    if summary is not None:
+        save_summary(table, summary)
+        checkpoint.record(table, key)
+        return "cache"
+
+    summary = await _write_summary(inputs, limits)
+    put_summary(key, summary)
+    save_summary(table, summary)
+    checkpoint.record(table, key)
+    return "llm"
+
+
+async def generate_summaries_async(tables=None, concurrency=SUMMARY_CONCURRENCY,
+                                   requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                                   tokens_per_minute=LLM_TOKENS_PER_MINUTE, resume=True, use_cache=True,
+                                   on_progress=None, cancel_event=None, checkpoint_path=CHECKPOINT_PATH):
+    """
+    Summarize `tables` (default: every documented table) with at most
+    `concurrency` requests in flight (map-reduce steps of wide tables included). A table that fails after its retries
+    is recorded in `errors` and does not stop the run.
+
+    on_progress, if given, is called as each table finishes with a dict like:
+        {"table", "status": "done"|"failed", "source", "completed", "total"}
+    Setting cancel_event (a threading.Event) stops workers from starting
+    new tables; tables in flight finish. resume=False ignores the
+    checkpoint; use_cache=False regenerates every table.
+
+    Returns (results, errors): results maps table -> {"source", "cache_key"}.
+    """
+    client = new_async_client()
+    if client is None:
+        raise RuntimeError("AI summaries are disabled. Set GROQ_API_KEY to generate summaries.")
+
+    tables = documented_tables() if tables is None else list(tables)
+    limits = _Limits(client, concurrency, requests_per_minute, tokens_per_minute)
+    checkpoint = Checkpoint(checkpoint_path, resume=resume)
+    queue = asyncio.Queue()
+    for table in tables:
+        queue.put_nowait(table)
+
+    results = {}
+    errors = {}
+
+    async def worker():
+        while not queue.empty():
+            table = queue.get_nowait()
+            if cancel_event is not None and cancel_event.is_set():
+                errors[table] = "cancelled"
+                continue
+
+            event = {"table": table, "total": len(tables)}
+            try:
+                source = await _summarize(table, checkpoint, limits, use_cache)
+                results[table] = {"source": source, "cache_key": checkpoint.done[table]}
+                event.update(status="done", source=source)
+            except Exception as e:
+                errors[table] = str(e)
+                event.update(status="failed", error=str(e))
+                print(f"❌ Summary failed for {table}: {e}")
+
+            event["completed"] = len(results) + len(errors)
+            if on_progress:
+                on_progress(event)
+
+    try:
+        async with client:
+            await asyncio.gather(*(worker() for _ in range(max(1, int(concurrency)))))
+    finally:
+        checkpoint.close()
+
+    print(f"✅ Summaries: {len(results)} done ({sum(r['source'] == 'llm' for r in results.values())} generated), "
+          f"{len(errors)} failed")
+    return results, errors
+
+
+def generate_summaries(tables=None, **options):
+    """Blocking wrapper around generate_summaries_async() for scripts and job threads"""
+    return asyncio.run(generate_summaries_async(tables, **options))
@@ -0,0 +1,10 @@
+import os
+
+# -----------------------------
+# SHARED PATHS
+# -----------------------------
+# metadata/<table>.json, quality reports, sketches, the quality history and
+# on-disk caches all live here; DATADOC_METADATA_DIR moves them together.
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+METADATA_DIR = os.getenv("DATADOC_METADATA_DIR", os.path.join(BASE_DIR, "metadata"))
@@ -1,14 +1,30 @@
+import collections
+import hashlib
 import os
-import psycopg2
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_connection():
-    """Get database connection (PostgreSQL for production, SQLite for local dev)"""
+def get_connection(check_same_thread=True, instrumented=False):
+    """Get database connection (PostgreSQL for production, SQLite for local dev)
+
+    check_same_thread=False lets a pooled SQLite connection be handed between
+    threads (it is still only used by one thread at a time). Connections are
+    instrumented (see QUERY LOG below) when DB_QUERY_LOG=1 or instrumented=True.
+    """
     try:
         # Try PostgreSQL first (production)
         if os.getenv("DB_HOST"):
+            # Imported here so SQLite setups (and cold starts) never pay for it
+            import psycopg2
             conn = psycopg2.connect(
                 host=os.getenv("DB_HOST"),
                 database=os.getenv("DB_NAME", "datadoc_ai"),
@@ -16,13 +32,473 @@ def get_connection():
                 password=os.getenv("DB_PASSWORD", ""),
                 port=os.getenv("DB_PORT", "5432")
             )
-            return conn
+            return instrument_connection(conn, instrumented)
         else:
             # Fallback to SQLite for local development
-            import sqlite3
-            DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "datadoc_demo.db")
-            conn = sqlite3.connect(DB_PATH)
-            return conn
+            DB_PATH = os.getenv(
+                "SQLITE_DB_PATH",
+                os.path.join(os.path.dirname(os.path.dirname(__file__)), "datadoc_demo.db")
+            )
+            conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread)
+            return instrument_connection(conn, instrumented)
     except Exception as e:
         print("❌ Database Connection Error:", e)
         return None
+
+
+def database_errors():
+    """Driver exception classes for `except database_errors():` (psycopg2 only once it has been imported)"""
+    psycopg2 = sys.modules.get("psycopg2")
+    return (sqlite3.Error, psycopg2.Error) if psycopg2 is not None else (sqlite3.Error,)
+
+
+def get_dialect(conn):
+    """Return the SQL dialect ("sqlite" or "postgresql") of a connection from get_connection()"""
+    if isinstance(getattr(conn, "raw_connection", conn), sqlite3.Connection):
+        return "sqlite"
+    return "postgresql"
+
+
+# -----------------------------
+# INSTRUMENTED CONNECTIONS + QUERY LOG
+# -----------------------------
+# Opt-in (DB_QUERY_LOG=1, or instrument_connection(conn, force=True)):
+# connections are wrapped so every statement's duration (execute plus
+# fetches), row count and caller reach the query log and any registered
+# listeners. The log keeps per-fingerprint stats (SQL with literals
+# redacted; parameters are never stored) and a bounded slow-query log,
+# optionally with the PostgreSQL EXPLAIN plan of each slow query.
+
+QUERY_LOG_ENABLED = os.getenv("DB_QUERY_LOG", "0") == "1"
+SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_SECONDS", "1.0"))
+SLOW_QUERY_EXPLAIN = os.getenv("DB_SLOW_QUERY_EXPLAIN", "0") == "1"
+SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "200"))
+MAX_QUERY_FINGERPRINTS = 2000
+
+# Called with each finished statement's record (see InstrumentedCursor._finish)
+QUERY_LISTENERS = []
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def add_query_listener(listener):
+    if listener not in QUERY_LISTENERS:
+        QUERY_LISTENERS.append(listener)
+
+
+def redact_sql(sql):
+    """SQL with string/number literals replaced by ? and whitespace collapsed"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("(?...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def query_fingerprint(redacted_sql):
+    return hashlib.sha1(redacted_sql.lower().encode("utf-8")).hexdigest()[:12]
+
+
+def _caller():
+    """module:function:line of the nearest frame outside this module"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{module}:{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+class QueryLog:
+    """Per-fingerprint statement stats plus the most recent slow queries"""
+
+    def __init__(self, slow_seconds=SLOW_QUERY_SECONDS, slow_log_size=SLOW_QUERY_LOG_SIZE):
+        self.slow_seconds = slow_seconds
+        self._stats = {}
+        self._slow = collections.deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, query):
+        redacted = redact_sql(query["sql"])
+        fingerprint = query_fingerprint(redacted)
+        with self._lock:
+            stats = self._stats.get(fingerprint)
+            if stats is None:
+                if len(self._stats) >= MAX_QUERY_FINGERPRINTS:
+                    return
+                stats = self._stats[fingerprint] = {
+                    "fingerprint": fingerprint, "sql": redacted[:2000], "calls": 0, "errors": 0,
+                    "total_seconds": 0.0, "max_seconds": 0.0, "rows": 0, "callers": []
+                }
+            stats["calls"] += 1
+            stats["errors"] += query["failed"]
+            stats["total_seconds"] += query["seconds"]
+            stats["max_seconds"] = max(stats["max_seconds"], query["seconds"])
+            stats["rows"] += query["rows"] or 0
+            if query["caller"] not in stats["callers"] and len(stats["callers"]) < 5:
+                stats["callers"].append(query["caller"])
+
+            if query["seconds"] >= self.slow_seconds:
+                self._slow.append({
+                    "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+                    "fingerprint": fingerprint, "sql": redacted[:2000], "seconds": round(query["seconds"], 4),
+                    "rows": query["rows"], "failed": query["failed"], "caller": query["caller"],
+                    "dialect": query["dialect"], "explain": query.get("explain")
+                })
+                print(f"🐢 Slow query ({query['seconds']:.2f}s) from {query['caller']}: {redacted[:200]}")
+
+    def stats(self, sort="total_seconds", limit=50):
+        if sort not in ("total_seconds", "max_seconds", "mean_seconds", "calls", "rows", "errors"):
+            raise ValueError(f"Unsupported sort: {sort}")
+        with self._lock:
+            rows = [dict(stats, callers=list(stats["callers"])) for stats in self._stats.values()]
+        for stats in rows:
+            stats["mean_seconds"] = stats["total_seconds"] / stats["calls"] if stats["calls"] else 0.0
+        rows.sort(key=lambda stats: stats[sort], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def slow_queries(self, limit=None):
+        with self._lock:
+            slow = list(self._slow)
+        slow.reverse()
+        return slow[:limit] if limit else slow
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+QUERY_LOG = QueryLog()
+
+
+def _dispatch_query(query):
+    if QUERY_LOG_ENABLED:
+        QUERY_LOG.record(query)
+    for listener in QUERY_LISTENERS:
+        listener(query)
+
+
+class InstrumentedCursor:
+    """
+    Cursor proxy that times each statement from execute() until its result
+    is exhausted (or the next execute()/close(), the cursor being dropped,
+    or its connection going back to the pool), counts rows, and reports the
+    finished record to the query log and QUERY_LISTENERS.
+    """
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._pending = None
+        connection._cursors.add(self)
+
+    def _start(self, method, sql, args):
+        self._finish()
+        caller = _caller() if QUERY_LOG_ENABLED else None
+        start = time.perf_counter()
+        try:
+            method(sql, *args)
+        except Exception:
+            self._pending = {"sql": sql, "args": args, "seconds": time.perf_counter() - start,
+                             "rows": None, "failed": True, "caller": caller}
+            self._finish()
+            raise
+        self._pending = {"sql": sql, "args": args, "seconds": time.perf_counter() - start,
+                         "rows": 0, "failed": False, "caller": caller}
+        if self._cursor.description is None and not getattr(self._cursor, "name", None):
+            # No result set (DML/DDL): done now, rows = affected rows.
+            # (psycopg2 named cursors only get a description on first fetch.)
+            self._pending["rows"] = max(self._cursor.rowcount, 0)
+            self._finish()
+
+    def _finish(self, explain=True):
+        query, self._pending = self._pending, None
+        if query is None:
+            return
+        query["dialect"] = self._connection.dialect
+        if (explain and SLOW_QUERY_EXPLAIN and QUERY_LOG_ENABLED and not query["failed"]
+                and query["seconds"] >= QUERY_LOG.slow_seconds and query["dialect"] == "postgresql"):
+            query["explain"] = self._connection.explain(query["sql"], query["args"])
+        del query["args"]
+        _dispatch_query(query)
+
+    def _fetched(self, start, rows, exhausted):
+        if self._pending is not None:
+            self._pending["seconds"] += time.perf_counter() - start
+            self._pending["rows"] += rows
+            if exhausted:
+                self._finish()
+
+    def execute(self, sql, *args):
+        self._start(self._cursor.execute, sql, args)
+        return self
+
+    def executemany(self, sql, *args):
+        self._start(self._cursor.executemany, sql, args)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        size = self._cursor.arraysize if size is None else size
+        rows = self._cursor.fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __del__(self):
+        # e.g. execute() + fetchone() on a single-row query, then the cursor is dropped.
+        # No EXPLAIN here: garbage collection may run while the connection is busy elsewhere.
+        try:
+            self._finish(explain=False)
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. itersize / arraysize belong to the real cursor
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursors; everything else is passed through"""
+
+    def __init__(self, conn):
+        self.raw_connection = conn
+        self.dialect = get_dialect(conn)
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw_connection.cursor(*args, **kwargs), self)
+
+    def finish_pending(self):
+        """Report statements whose results were never exhausted (called before pooling / closing)"""
+        for cursor in list(self._cursors):
+            cursor._finish()
+
+    def explain(self, sql, args):
+        """Plain EXPLAIN (the statement is not re-run) of a slow SELECT, or None"""
+        if not sql.lstrip().lower().startswith(("select", "with")):
+            return None
+        try:
+            cursor = self.raw_connection.cursor()
+            cursor.execute("EXPLAIN " + sql, *args)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            cursor.close()
+            return plan
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+
+    def __getattr__(self, name):
+        return getattr(self.raw_connection, name)
+
+
+def instrument_connection(conn, force=False):
+    """Wrap a connection for the query log / listeners (no-op unless DB_QUERY_LOG=1 or force=True)"""
+    if conn is None or isinstance(conn, InstrumentedConnection) or not (force or QUERY_LOG_ENABLED):
+        return conn
+    return InstrumentedConnection(conn)
+
+
+def open_streaming_cursor(conn, name, batch_size=5000):
+    """
+    Cursor that streams large results instead of buffering them client-side.
+
+    psycopg2 needs a named (server-side) cursor for that; sqlite3 cursors
+    already step through results lazily. Read with fetchmany(batch_size).
+    """
+    if get_dialect(conn) == "postgresql":
+        cursor = conn.cursor(name=name)
+        cursor.itersize = batch_size
+        return cursor
+    return conn.cursor()
+
+
+# -----------------------------
+# STATEMENT TIMEOUTS
+# -----------------------------
+
+def set_statement_timeout(conn, seconds):
+    """Abort any statement on this connection that runs longer than `seconds`"""
+    if get_dialect(conn) == "postgresql":
+        cursor = conn.cursor()
+        cursor.execute("SET statement_timeout = %s", (int(seconds * 1000),))
+        cursor.close()
+    else:
+        # SQLite has no server-side timeout: interrupt from the progress handler
+        deadline = time.monotonic() + seconds
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+
+
+def clear_statement_timeout(conn):
+    if get_dialect(conn) == "postgresql":
+        cursor = conn.cursor()
+        cursor.execute("SET statement_timeout = 0")
+        cursor.close()
+    else:
+        conn.set_progress_handler(None, 0)
+
+
+# -----------------------------
+# CONNECTION POOL
+# -----------------------------
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of connections from get_connection().
+
+    max_lifetime recycles connections older than that many seconds;
+    check_after pings a connection that sat idle longer than that before
+    handing it out, replacing it if the ping fails. Connections are rolled
+    back on release so none sits "idle in transaction". instrumented=True
+    wraps every connection for the query log / QUERY_LISTENERS.
+    """
+
+    def __init__(self, max_size=5, max_lifetime=None, check_after=None, instrumented=False):
+        self.max_size = max_size
+        self.instrumented = instrumented
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._all = []
+        self._created = {}
+        self._last_used = {}
+        self.recycled = 0
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a pooled database connection")
+
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self._usable(conn):
+                    return conn
+                self._close(conn)
+                self.recycled += 1
+
+            conn = get_connection(check_same_thread=False, instrumented=self.instrumented)
+            if conn is None:
+                raise ConnectionError("Database connection failed")
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._all.append(conn)
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _usable(self, conn):
+        now = time.monotonic()
+        if getattr(conn, "closed", False):
+            return False
+        if self.max_lifetime is not None and now - self._created.get(id(conn), now) > self.max_lifetime:
+            return False
+        if self.check_after is not None and now - self._last_used.get(id(conn), now) > self.check_after:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                cursor.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def release(self, conn, discard=False):
+        if isinstance(conn, InstrumentedConnection):
+            conn.finish_pending()
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._close(conn)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection; it is discarded instead of reused if the block raises a DB error"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except database_errors():
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._all)
+        idle = self._idle.qsize()
+        return {"max_size": self.max_size, "open": size, "idle": idle, "in_use": size - idle,
+                "recycled": self.recycled}
+
+    def _close(self, conn):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+            self._created.pop(id(conn), None)
+            self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, []
+            self._created.clear()
+            self._last_used.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,191 @@
+import hashlib
+import math
+from contextlib import closing
+from backend.db_connector import open_streaming_cursor
+from backend.profiler import (
+    estimate_row_count, quote_ident, sampled_from_clause, to_json_value, unique_index_columns
+)
+
+# -----------------------------
+# DUPLICATE KEY DETECTION
+# -----------------------------
+# Checks every primary-key column together (composite keys included):
+#   1) "constraint": a unique index/constraint already guarantees no duplicates
+#   2) "sql":        GROUP BY ... HAVING COUNT(*) > 1 pushed down to the DB
+#   3) "stream":     two passes over a server-side cursor for tables too big
+#                    to GROUP BY without spilling: a Bloom filter flags
+#                    candidate keys, then a verification pass counts only
+#                    those candidates exactly.
+
+# Tables above this many rows use the streaming check instead of GROUP BY
+SQL_GROUP_BY_MAX_ROWS = 5_000_000
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+# Stop collecting candidates past this many (bounds memory of the verification pass)
+MAX_CANDIDATE_KEYS = 1_000_000
+SAMPLE_DUPLICATES = 10
+
+
+class TooManyCandidateKeys(MemoryError):
+    """The streaming check collected more than MAX_CANDIDATE_KEYS candidates"""
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit key hashes"""
+
+    def __init__(self, expected_items, false_positive_rate=BLOOM_FALSE_POSITIVE_RATE):
+        expected_items = max(1, expected_items)
+        self.size = max(8, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key_hash):
+        # Double hashing: h1 + i * h2
+        h1 = key_hash & 0xFFFFFFFF
+        h2 = (key_hash >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key_hash):
+        """Add a hash; returns True if it was (probably) already present"""
+        present = True
+        for position in self._positions(key_hash):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        return present
+
+
+def _key_hash(key):
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _not_null_filter(key_columns):
+    return " AND ".join(f"{quote_ident(col)} IS NOT NULL" for col in key_columns)
+
+
+def _result(key_columns, method, counts, samples):
+    return {
+        "key_columns": key_columns,
+        "method": method,
+        "duplicate_keys": len(counts) if counts is not None else 0,
+        "duplicate_rows": sum(count - 1 for count in counts) if counts is not None else 0,
+        "sample_duplicates": samples
+    }
+
+
+def _sample(key_columns, duplicates, limit):
+    top = sorted(duplicates, key=lambda item: item[1], reverse=True)[:limit]
+    return [
+        {"key": {col: to_json_value(value) for col, value in zip(key_columns, key)}, "count": count}
+        for key, count in top
+    ]
+
+
+def _duplicates_sql(cursor, table, key_columns, dialect, schema, sample_limit):
+    keys = ", ".join(quote_ident(col) for col in key_columns)
+    cursor.execute(
+        f"SELECT {keys}, COUNT(*) "
+        + sampled_from_clause(table, dialect, schema, where=_not_null_filter(key_columns))
+        + f" GROUP BY {keys} HAVING COUNT(*) > 1"
+    )
+    duplicates = [(tuple(row[:-1]), row[-1]) for row in cursor.fetchall()]
+    return _result(key_columns, "sql", [count for _, count in duplicates],
+                   _sample(key_columns, duplicates, sample_limit))
+
+
+def _stream_keys(conn, table, key_columns, dialect, schema, batch_size):
+    cursor = open_streaming_cursor(conn, f"dupkeys_{table}", batch_size)
+    cursor.execute(
+        "SELECT " + ", ".join(quote_ident(col) for col in key_columns) + " "
+        + sampled_from_clause(table, dialect, schema, where=_not_null_filter(key_columns))
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        cursor.close()
+
+
+def _duplicates_stream(conn, table, key_columns, dialect, schema, expected_rows,
+                       sample_limit, batch_size):
+    # Pass 1: Bloom filter flags keys that (probably) appeared before
+    bloom = BloomFilter(expected_rows or 1_000_000)
+    candidates = set()
+    with closing(_stream_keys(conn, table, key_columns, dialect, schema, batch_size)) as keys:
+        for key in keys:
+            key_hash = _key_hash(key)
+            if bloom.add(key_hash):
+                candidates.add(key_hash)
+                if len(candidates) > MAX_CANDIDATE_KEYS:
+                    raise TooManyCandidateKeys(
+                        f"More than {MAX_CANDIDATE_KEYS} candidate duplicate keys in {table}; "
+                        "use the SQL check instead"
+                    )
+
+    if not candidates:
+        return _result(key_columns, "stream", [], [])
+
+    # Pass 2: exact counts, but only for candidate keys (filters out Bloom false positives)
+    counts = {}
+    for key in _stream_keys(conn, table, key_columns, dialect, schema, batch_size):
+        if _key_hash(key) in candidates:
+            counts[key] = counts.get(key, 0) + 1
+
+    duplicates = [(key, count) for key, count in counts.items() if count > 1]
+    return _result(key_columns, "stream", [count for _, count in duplicates],
+                   _sample(key_columns, duplicates, sample_limit))
+
+
+def find_duplicate_keys(conn, table, key_columns, dialect="sqlite", schema="public",
+                        row_count=None, strategy="auto", sample_limit=SAMPLE_DUPLICATES,
+                        batch_size=10000):
+    """
+    Find rows sharing the same (composite) key.
+
+    strategy="auto" skips the scan when a unique index covers the key, uses
+    SQL GROUP BY up to SQL_GROUP_BY_MAX_ROWS rows and the streaming Bloom
+    filter check above that, falling back to GROUP BY if the stream finds
+    too many candidates. "sql" / "stream" force a method (a forced stream
+    raises TooManyCandidateKeys instead).
+
+    Returns {"key_columns", "method", "duplicate_keys" (distinct keys that
+    repeat), "duplicate_rows" (surplus rows), "sample_duplicates"}.
+    Rows with a NULL in any key column are ignored.
+    """
+    if not key_columns:
+        return None
+    if strategy not in ("auto", "sql", "stream"):
+        raise ValueError(f"Unsupported duplicate check strategy: {strategy}")
+
+    requested = strategy
+    cursor = conn.cursor()
+    try:
+        if strategy == "auto":
+            key_set = set(key_columns)
+            if any(columns <= key_set for columns in unique_index_columns(cursor, table, dialect, schema)):
+                return _result(key_columns, "constraint", [], [])
+
+            if row_count is None:
+                row_count = estimate_row_count(cursor, table, dialect, schema)
+            strategy = "stream" if row_count and row_count > SQL_GROUP_BY_MAX_ROWS else "sql"
+
+        if strategy == "sql":
+            return _duplicates_sql(cursor, table, key_columns, dialect, schema, sample_limit)
+    finally:
+        cursor.close()
+
+    try:
+        return _duplicates_stream(conn, table, key_columns, dialect, schema, row_count,
+                                  sample_limit, batch_size)
+    except TooManyCandidateKeys as e:
+        if requested != "auto":
+            raise
+        print(f"⚠️ {e}; falling back to GROUP BY")
+
+    with closing(conn.cursor()) as cursor:
+        return _duplicates_sql(cursor, table, key_columns, dialect, schema, sample_limit)
@@ -0,0 +1,306 @@
+import datetime
+import hashlib
+import os
+from backend.profiler import (
+    find_freshness_column, param_placeholder, profile_table, quote_ident, table_ref
+)
+
+# -----------------------------
+# INCREMENTAL (WATERMARK) QUALITY REFRESH
+# -----------------------------
+# Append-only tables only need their new rows profiled. Each exact report
+# stores a watermark (MAX of an integer PK, else of the freshness column);
+# the next run profiles rows past it and merges the delta counts in.
+# Any sign of deletes/updates/back-dated inserts falls back to a full rescan.
+#
+# PostgreSQL detects changes from the pg_stat_user_tables counters. SQLite
+# has no such counters, so by default it compares row counts of the old
+# range (catches deletes and back-dated inserts, not in-place UPDATEs of
+# other columns). INCREMENTAL_CHECKSUM=1 adds a full-content checksum of the
+# old range that also catches those, at the cost of hashing every cell in
+# Python on each run - usually slower than a full rescan.
+
+# Force a full rescan after this many incremental merges in a row
+MAX_INCREMENTAL_RUNS = 24
+INCREMENTAL_CHECKSUM = os.getenv("INCREMENTAL_CHECKSUM", "0") == "1"
+
+# Declared types (before any "(n)" / "UNSIGNED") that hold integers
+INTEGER_TYPES = {
+    "INTEGER", "INT", "INT2", "INT4", "INT8", "SMALLINT", "BIGINT", "TINYINT", "MEDIUMINT",
+    "SERIAL", "SMALLSERIAL", "BIGSERIAL", "SERIAL4", "SERIAL8"
+}
+CHECKSUM_MODULUS = 2 ** 61 - 1
+
+
+def is_integer_type(data_type):
+    """True for integer column types (not POINT, INTERVAL or other names that merely contain "INT")"""
+    words = str(data_type or "").upper().split("(")[0].split()
+    return bool(words) and (words[0] in INTEGER_TYPES or words[-1] in INTEGER_TYPES)
+
+
+def choose_watermark_column(meta):
+    """Prefer a single integer PK (strictly increasing on insert), else the freshness column"""
+    pks = meta["primary_keys"]
+    if len(pks) == 1:
+        for col in meta["columns"]:
+            if col["column_name"] == pks[0] and is_integer_type(col.get("data_type")):
+                return pks[0]
+    return find_freshness_column(meta)
+
+
+def _change_counters(cursor, table, dialect, schema):
+    """Cumulative pg_stat_user_tables counters: (UPDATE + DELETE count, INSERT count); (None, None) on SQLite"""
+    if dialect != "postgresql":
+        return None, None
+
+    cursor.execute(
+        "SELECT n_tup_upd + n_tup_del, n_tup_ins FROM pg_stat_user_tables WHERE relid = to_regclass(%s)",
+        (f"{quote_ident(schema)}.{quote_ident(table)}",)
+    )
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None, None
+    return int(row[0]), int(row[1])
+
+
+def _max_rowid(cursor, table, schema):
+    """Highest rowid on SQLite (None for WITHOUT ROWID tables)"""
+    try:
+        cursor.execute(f"SELECT MAX(rowid) FROM {table_ref(table, 'sqlite', schema)}")
+    except Exception:
+        return None
+    return cursor.fetchone()[0]
+
+
+def _old_rows_changed(cursor, table, column, watermark, total_rows, schema):
+    """
+    SQLite: True unless both the rows at or below the watermark (NULLs
+    included) and the rows up to the stored max rowid still number
+    total_rows. Two counts, no hashing.
+    """
+    col = quote_ident(column)
+    ref = table_ref(table, "sqlite", schema)
+    sql = f"SELECT (SELECT COUNT(*) FROM {ref} WHERE {col} <= ? OR {col} IS NULL)"
+    params = [watermark["value"]]
+    if watermark.get("max_rowid") is not None:
+        sql += f", (SELECT COUNT(*) FROM {ref} WHERE rowid <= ?)"
+        params.append(watermark["max_rowid"])
+    cursor.execute(sql, params)
+    return any(count != total_rows for count in cursor.fetchone())
+
+
+def _inserts_after_scan(cursor, table, dialect, schema):
+    """
+    INSERT count to store with a fresh report, read after its scan: rows
+    inserted during the scan are then not counted again next run.
+    """
+    return _change_counters(cursor, table, dialect, schema)[1]
+
+
+class _RowChecksum:
+    """SQLite aggregate: order-independent sum of per-row hashes (mod a Mersenne prime)"""
+
+    def __init__(self):
+        self.total = 0
+
+    def step(self, *values):
+        digest = hashlib.blake2b(repr(values).encode("utf-8"), digest_size=8).digest()
+        self.total = (self.total + int.from_bytes(digest, "big")) % CHECKSUM_MODULUS
+
+    def finalize(self):
+        return self.total
+
+
+def _range_checksum(cursor, table, meta, column, low, high, schema):
+    """
+    Checksum of every column of the rows with low < column <= high (SQLite).
+
+    low=None starts at the bottom and includes NULL watermark values, which
+    count as old rows. Sums of per-row hashes add up, so the checksum of the
+    whole old range is carried forward as old + delta on each merge.
+    """
+    cursor.connection.create_aggregate("datadoc_row_checksum", -1, _RowChecksum)
+    columns = ", ".join(quote_ident(col["column_name"]) for col in meta["columns"])
+    col = quote_ident(column)
+    if low is None:
+        where, params = f"{col} <= ? OR {col} IS NULL", (high,)
+    else:
+        where, params = f"{col} > ? AND {col} <= ?", (low, high)
+    cursor.execute(
+        f"SELECT datadoc_row_checksum({columns}) FROM {table_ref(table, 'sqlite', schema)} WHERE {where}",
+        params
+    )
+    return cursor.fetchone()[0]
+
+
+def _shared_keys(cursor, table, pk, column, value, dialect, schema):
+    """Distinct PK values that appear both in the delta and below the watermark"""
+    mark = param_placeholder(dialect)
+    ref = table_ref(table, dialect, schema)
+    cursor.execute(
+        f"SELECT COUNT(DISTINCT {quote_ident(pk)}) FROM {ref} "
+        f"WHERE {quote_ident(column)} > {mark} AND {quote_ident(pk)} IN ("
+        f"SELECT {quote_ident(pk)} FROM {ref} WHERE {quote_ident(column)} <= {mark})",
+        (value, value)
+    )
+    return cursor.fetchone()[0]
+
+
+def full_rescan_reason(previous, meta, watermark_column):
+    """Why the previous report can't be extended incrementally (None if it can)"""
+    if not previous:
+        return "no previous report"
+    if previous.get("mode") != "exact":
+        return "previous report was approximate"
+
+    watermark = previous.get("watermark")
+    if not watermark or watermark.get("value") is None:
+        return "no stored watermark"
+    if watermark.get("column") != watermark_column:
+        return "watermark column changed"
+    if watermark.get("incremental_runs", 0) >= MAX_INCREMENTAL_RUNS:
+        return "periodic full rescan"
+    if "duplicate_rows" not in previous:
+        return "report format changed"
+
+    columns = [col["column_name"] for col in meta["columns"]]
+    if sorted(previous.get("column_completeness", {})) != sorted(columns):
+        return "schema changed"
+    return None
+
+
+def _stamp_watermark(report, kind, incremental_runs, modifications, inserts, max_rowid, checksum):
+    report["watermark"].update({
+        "kind": kind,
+        "incremental_runs": incremental_runs,
+        "modifications": modifications,
+        "inserts": inserts,
+        "max_rowid": max_rowid,
+        "checksum": checksum,
+        "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    })
+
+
+def merge_delta(previous, delta, shared_keys=0):
+    """Merge the profile of the new rows into the previous exact report"""
+    total_rows = previous["total_rows"] + delta["total_rows"]
+    duplicate_rows = previous["duplicate_rows"] + delta["duplicate_rows"] + shared_keys
+
+    column_quality = {}
+    for col_name, old in previous["column_completeness"].items():
+        non_null_count = old["non_null_count"] + delta["column_completeness"][col_name]["non_null_count"]
+
+        completeness = 0
+        if total_rows > 0:
+            completeness = round((non_null_count / total_rows) * 100, 2)
+
+        column_quality[col_name] = {
+            "non_null_count": non_null_count,
+            "completeness_percent": completeness
+        }
+
+    last_updated = previous.get("last_updated")
+    if delta.get("last_updated") is not None:
+        last_updated = delta["last_updated"] if last_updated is None else max(last_updated, delta["last_updated"])
+
+    watermark = dict(previous["watermark"])
+    if delta["watermark"]["value"] is not None:
+        watermark["value"] = delta["watermark"]["value"]
+
+    return {
+        "mode": "exact",
+        "total_rows": total_rows,
+        "row_count_type": "exact",
+        "column_completeness": column_quality,
+        "duplicate_primary_keys": 0 if duplicate_rows == 0 else None,
+        # Exact: surplus rows of the old and new ranges plus the keys they share
+        "duplicate_rows": duplicate_rows,
+        "freshness_column": delta["freshness_column"],
+        "last_updated": last_updated,
+        "watermark": watermark
+    }
+
+
+def profile_table_incremental(cursor, table, meta, previous, dialect="sqlite", schema="public",
+                              force_full=False, checksum=INCREMENTAL_CHECKSUM):
+    """
+    Profile only the rows past the stored watermark and merge them into `previous`.
+
+    Falls back to a full exact profile (recording a fresh watermark) when
+    there is no usable previous report or the rows at or below the
+    watermark changed: on PostgreSQL via the pg_stat_user_tables counters
+    (any UPDATE/DELETE, or more INSERTs than delta rows), on SQLite via the
+    old range's row counts, plus its content checksum when checksum=True.
+    Every report carries a "refresh" entry saying which path produced it.
+    """
+    watermark_column = choose_watermark_column(meta)
+    # UPDATE/DELETE counts are taken before scanning so changes made during the scan show up next run
+    modifications, inserts = _change_counters(cursor, table, dialect, schema)
+    checksum = checksum and dialect != "postgresql" and not force_full
+
+    if force_full:
+        reason = "full refresh requested"
+    elif not watermark_column:
+        reason = "no watermark column"
+    else:
+        reason = full_rescan_reason(previous, meta, watermark_column)
+
+    delta = None
+    if reason is None:
+        watermark = previous["watermark"]
+        if dialect == "postgresql":
+            if (modifications is None or watermark.get("inserts") is None
+                    or modifications != watermark.get("modifications")):
+                reason = "updates or deletes detected"
+        elif _old_rows_changed(cursor, table, watermark_column, watermark, previous["total_rows"], schema):
+            reason = "rows at or below the watermark changed"
+        elif checksum and (
+            watermark.get("checksum") is None
+            or _range_checksum(cursor, table, meta, watermark_column, None, watermark["value"], schema)
+            != watermark["checksum"]
+        ):
+            reason = "rows at or below the watermark changed"
+
+    if reason is None:
+        mark = param_placeholder(dialect)
+        delta = profile_table(
+            cursor, table, meta, dialect, schema,
+            where=f"{quote_ident(watermark_column)} > {mark}", params=(watermark["value"],),
+            watermark_column=watermark_column
+        )
+        # More INSERTs than delta rows: some landed at or below the watermark (or with a NULL one).
+        # Fewer is fine - rows committed during the scan or a stats flush still pending.
+        if dialect == "postgresql" and inserts - watermark["inserts"] > delta["total_rows"]:
+            reason = "inserts at or below the watermark detected"
+
+    if reason is not None:
+        report = profile_table(cursor, table, meta, dialect, schema, watermark_column=watermark_column)
+        if watermark_column:
+            max_rowid = row_checksum = None
+            if dialect != "postgresql":
+                max_rowid = _max_rowid(cursor, table, schema)
+                if checksum and report["watermark"]["value"] is not None:
+                    row_checksum = _range_checksum(cursor, table, meta, watermark_column, None,
+                                                   report["watermark"]["value"], schema)
+            _stamp_watermark(report, "primary_key" if watermark_column in meta["primary_keys"] else "freshness",
+                             0, modifications, _inserts_after_scan(cursor, table, dialect, schema),
+                             max_rowid, row_checksum)
+        report["refresh"] = {"type": "full", "reason": reason}
+        return report
+
+    # PK watermarks can't overlap older keys; freshness watermarks can
+    shared_keys = 0
+    pk = meta["primary_keys"][0] if meta["primary_keys"] else None
+    if delta["total_rows"] and pk and watermark.get("kind") == "freshness":
+        shared_keys = _shared_keys(cursor, table, pk, watermark_column, watermark["value"], dialect, schema)
+
+    report = merge_delta(previous, delta, shared_keys)
+    max_rowid = _max_rowid(cursor, table, schema) if dialect != "postgresql" else None
+    row_checksum = watermark.get("checksum") if checksum else None
+    if row_checksum is not None and report["watermark"]["value"] != watermark["value"]:
+        row_checksum = (row_checksum + _range_checksum(cursor, table, meta, watermark_column, watermark["value"],
+                                                       report["watermark"]["value"], schema)) % CHECKSUM_MODULUS
+    _stamp_watermark(report, watermark.get("kind"), watermark.get("incremental_runs", 0) + 1,
+                     modifications, _inserts_after_scan(cursor, table, dialect, schema), max_rowid, row_checksum)
+    report["refresh"] = {"type": "incremental", "delta_rows": delta["total_rows"]}
+    return report
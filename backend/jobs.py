@@ -0,0 +1,182 @@
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------------
+# BACKGROUND JOBS
+# -----------------------------
+# Long refreshes run on a small worker pool instead of inside the request.
+# Submitting a job identical (same kind + params) to one that is still
+# queued or running returns the existing job. Finished jobs are kept for
+# JOB_RETENTION seconds so clients can collect the result.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+MAX_FINISHED_JOBS = 200
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class Job:
+    """One unit of background work; the target reports progress and polls cancellation through it"""
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.progress = {"completed": 0, "total": None, "message": None}
+        self.result = None
+        self.error = None
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._finished_monotonic = None
+
+    @property
+    def finished(self):
+        return self.status not in ACTIVE_STATUSES
+
+    def report(self, completed=None, total=None, message=None):
+        if completed is not None:
+            self.progress["completed"] = completed
+        if total is not None:
+            self.progress["total"] = total
+        if message is not None:
+            self.progress["message"] = message
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def to_dict(self, include_result=True):
+        job = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if include_result:
+            job["result"] = self.result
+        return job
+
+
+class JobRunner:
+    """Runs target(job) callables on a bounded thread pool, deduplicating identical active jobs"""
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, target, on_finish=None, **params):
+        """
+        Queue target(job) and return (job, created). created=False means an
+        identical job was already queued or running and is returned instead.
+        on_finish(job), if given, runs after the job reaches a final status.
+        """
+        key = (kind, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            self._prune()
+            existing = self._active.get(key)
+            if existing is not None and not existing.finished:
+                return existing, False
+
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._active[key] = job
+
+        self._executor.submit(self._run, job, key, target, on_finish)
+        return job, True
+
+    def _run(self, job, key, target, on_finish):
+        try:
+            job.check_cancelled()
+            job.status = "running"
+            job.started_at = _now()
+            job.result = target(job)
+            job.status = "cancelled" if job.cancel_event.is_set() else "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Job {job.kind} ({job.id}) failed: {e}")
+        finally:
+            job.finished_at = _now()
+            job._finished_monotonic = time.monotonic()
+            with self._lock:
+                if self._active.get(key) is job:
+                    del self._active[key]
+
+        if on_finish:
+            try:
+                on_finish(job)
+            except Exception as e:
+                print(f"⚠️ on_finish hook for job {job.id} failed: {e}")
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def list(self, kind=None):
+        with self._lock:
+            self._prune()
+            return [job for job in self._jobs.values() if kind is None or job.kind == kind]
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs never start, running jobs stop at their next check"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_event.set()
+            # A new identical request should start fresh rather than join a job being cancelled
+            for key, active in list(self._active.items()):
+                if active is job:
+                    del self._active[key]
+            return job
+
+    def _prune(self):
+        now = time.monotonic()
+        finished = [job for job in self._jobs.values() if job.finished and job._finished_monotonic is not None]
+        expired = {job.id for job in finished if now - job._finished_monotonic > self.retention}
+        # Also cap how many finished jobs are remembered (oldest first)
+        overflow = len(finished) - len(expired) - MAX_FINISHED_JOBS
+        for job in finished:
+            if overflow <= 0:
+                break
+            if job.id not in expired:
+                expired.add(job.id)
+                overflow -= 1
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.finished:
+                    job.cancel_event.set()
+        self._executor.shutdown(wait=False)
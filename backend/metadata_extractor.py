@@ -1,61 +1,404 @@
+import hashlib
 import json
 import os
-from backend.db_connector import get_connection
+import threading
+from backend.config import METADATA_DIR
+from backend.db_connector import get_connection, get_dialect, open_streaming_cursor
 
 
-# Path where metadata will be stored
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-METADATA_DIR = os.path.join(BASE_DIR, "metadata")
+# Schema fingerprint cache (kept out of METADATA_DIR's *.json table listing)
+SCHEMA_CACHE_PATH = os.path.join(METADATA_DIR, "cache", "schema_cache.json")
+# Just the version number, so catalog_version() doesn't parse every table's metadata
+SCHEMA_VERSION_PATH = os.path.join(METADATA_DIR, "cache", "schema_version")
+# How many change-log entries to keep for changes_since() (trimmed at whole versions)
+MAX_CHANGE_LOG = 5000
 
-def extract_metadata():
-    conn = get_connection()
-    cursor = conn.cursor()
+_cache_lock = threading.Lock()
+
+
+# -----------------------------
+# CATALOG READERS
+# -----------------------------
+# Columns, primary keys, foreign keys and indexes for every table come from
+# a handful of set-based catalog queries per dialect, never one round trip
+# per table.
+
+def _empty_table(table):
+    return {"table_name": table, "columns": [], "primary_keys": [], "foreign_keys": [], "indexes": []}
+
+
+def _read_sqlite_catalog(cursor, tables=None):
+    where, params = "m.type = 'table' AND m.name NOT LIKE 'sqlite_%'", []
+    if tables is not None:
+        where += " AND m.name IN (" + ", ".join("?" for _ in tables) + ")"
+        params = list(tables)
+
+    cursor.execute(f"SELECT m.name FROM sqlite_master m WHERE {where} ORDER BY m.name", params)
+    all_metadata = {row[0]: _empty_table(row[0]) for row in cursor.fetchall()}
+
+    # Columns (pk is the 1-based position in a possibly composite key)
+    cursor.execute(f"""
+        SELECT m.name, p.name, p.type, p."notnull", p.dflt_value, p.pk
+        FROM sqlite_master m JOIN pragma_table_info(m.name) p
+        WHERE {where}
+        ORDER BY m.name, p.cid
+    """, params)
+    pk_positions = {}
+    for table, column, data_type, not_null, default_value, pk in cursor.fetchall():
+        all_metadata[table]["columns"].append({
+            "column_name": column,
+            "data_type": data_type,
+            "not_null": bool(not_null),
+            "default_value": default_value
+        })
+        if pk > 0:
+            pk_positions.setdefault(table, []).append((pk, column))
+    for table, positions in pk_positions.items():
+        all_metadata[table]["primary_keys"] = [column for _, column in sorted(positions)]
+
+    # Foreign keys: one row per column, id groups multi-column keys
+    cursor.execute(f"""
+        SELECT m.name, f.id, f."table", f."from", f."to"
+        FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) f
+        WHERE {where}
+        ORDER BY m.name, f.id, f.seq
+    """, params)
+    foreign_keys = {}
+    for table, fk_id, referred_table, column, referred_column in cursor.fetchall():
+        fk = foreign_keys.setdefault((table, fk_id), {
+            "name": None, "columns": [], "referred_table": referred_table, "referred_columns": []
+        })
+        fk["columns"].append(column)
+        fk["referred_columns"].append(referred_column)
+
+    # Indexes, including the automatic ones behind PRIMARY KEY / UNIQUE
+    cursor.execute(f"""
+        SELECT m.name, il.name, il."unique", il.origin, il.partial, ii.name
+        FROM sqlite_master m
+        JOIN pragma_index_list(m.name) il
+        JOIN pragma_index_info(il.name) ii
+        WHERE {where}
+        ORDER BY m.name, il.name, ii.seqno
+    """, params)
+    indexes = {}
+    for table, index_name, unique, origin, partial, column in cursor.fetchall():
+        index = indexes.setdefault((table, index_name), {
+            "name": index_name, "columns": [], "unique": bool(unique),
+            "primary": origin == "pk", "partial": bool(partial)
+        })
+        index["columns"].append(column)
+
+    for (table, _), fk in foreign_keys.items():
+        all_metadata[table]["foreign_keys"].append(fk)
+    for (table, _), index in indexes.items():
+        all_metadata[table]["indexes"].append(index)
+    return all_metadata
+
+
+def _read_postgres_catalog(cursor, schema="public", tables=None):
+    where, params = "n.nspname = %s AND t.relkind IN ('r', 'p')", [schema]
+    if tables is not None:
+        where += " AND t.relname = ANY(%s)"
+        params.append(list(tables))
+    user_tables = "pg_class t JOIN pg_namespace n ON n.oid = t.relnamespace"
+
+    cursor.execute(f"SELECT t.relname FROM {user_tables} WHERE {where} ORDER BY t.relname", params)
+    all_metadata = {row[0]: _empty_table(row[0]) for row in cursor.fetchall()}
+
+    # Columns; data_type and max_length match information_schema.columns
+    cursor.execute(f"""
+        SELECT t.relname, a.attname, format_type(a.atttypid, NULL), a.attnotnull,
+               pg_get_expr(d.adbin, d.adrelid),
+               CASE WHEN a.atttypid IN ('bpchar'::regtype, 'varchar'::regtype) AND a.atttypmod > 0
+                    THEN a.atttypmod - 4 END
+        FROM {user_tables}
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE {where}
+        ORDER BY t.relname, a.attnum
+    """, params)
+    for table, column, data_type, not_null, default_value, max_length in cursor.fetchall():
+        all_metadata[table]["columns"].append({
+            "column_name": column,
+            "data_type": data_type,
+            "not_null": not_null,
+            "default_value": default_value,
+            "max_length": max_length
+        })
+
+    # Indexes (the primary key is the one with indisprimary); expression
+    # parts of an index have attnum 0 and are left out of its column list
+    cursor.execute(f"""
+        SELECT t.relname, i.relname, x.indisunique, x.indisprimary, x.indpred IS NOT NULL,
+               array_agg(a.attname::text ORDER BY k.ord)
+        FROM {user_tables}
+        JOIN pg_index x ON x.indrelid = t.oid
+        JOIN pg_class i ON i.oid = x.indexrelid
+        CROSS JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+        WHERE {where}
+        GROUP BY t.relname, i.relname, x.indisunique, x.indisprimary, x.indpred IS NOT NULL
+        ORDER BY t.relname, i.relname
+    """, params)
+    for table, index_name, unique, primary, partial, columns in cursor.fetchall():
+        all_metadata[table]["indexes"].append({
+            "name": index_name, "columns": list(columns), "unique": unique,
+            "primary": primary, "partial": partial
+        })
+        if primary:
+            all_metadata[table]["primary_keys"] = list(columns)
+
+    # Foreign keys, with multi-column keys paired up position by position
+    cursor.execute(f"""
+        SELECT t.relname, c.conname, r.relname,
+               array_agg(a.attname::text ORDER BY k.ord), array_agg(ra.attname::text ORDER BY k.ord)
+        FROM {user_tables}
+        JOIN pg_constraint c ON c.conrelid = t.oid AND c.contype = 'f'
+        JOIN pg_class r ON r.oid = c.confrelid
+        CROSS JOIN LATERAL unnest(c.conkey, c.confkey) WITH ORDINALITY AS k(attnum, ref_attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+        JOIN pg_attribute ra ON ra.attrelid = c.confrelid AND ra.attnum = k.ref_attnum
+        WHERE {where}
+        GROUP BY t.relname, c.conname, r.relname
+        ORDER BY t.relname, c.conname
+    """, params)
+    for table, constraint_name, referred_table, columns, referred_columns in cursor.fetchall():
+        all_metadata[table]["foreign_keys"].append({
+            "name": constraint_name, "columns": list(columns),
+            "referred_table": referred_table, "referred_columns": list(referred_columns)
+        })
+
+    return all_metadata
+
+
+def _table_names_sql(dialect, schema, after=None, limit=None):
+    """Keyset-ordered table names (name > after), optionally LIMITed"""
+    if dialect == "postgresql":
+        sql = """
+            SELECT t.relname FROM pg_class t JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE n.nspname = %s AND t.relkind IN ('r', 'p')
+        """
+        params = [schema]
+        placeholder = "%s"
+    else:
+        sql = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        params = []
+        placeholder = "?"
+
+    name_column = "t.relname" if dialect == "postgresql" else "name"
+    if after is not None:
+        sql += f" AND {name_column} > {placeholder}"
+        params.append(after)
+    sql += f" ORDER BY {name_column}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+
+def list_tables(cursor, dialect, schema="public", after=None, limit=None):
+    """Table names in order, starting after `after` (keyset pagination)"""
+    sql, params = _table_names_sql(dialect, schema, after, limit)
+    cursor.execute(sql, params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def iter_table_batches(conn, dialect, schema="public", batch_size=500):
+    """Yield lists of table names from a server-side cursor, so memory stays flat for any catalog size"""
+    cursor = open_streaming_cursor(conn, "table_names", batch_size)
+    sql, params = _table_names_sql(dialect, schema)
+    cursor.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+    finally:
+        cursor.close()
+
+
+def read_catalog(cursor, dialect, schema="public", tables=None):
+    """
+    {table: {"table_name", "columns", "primary_keys", "foreign_keys", "indexes"}}
+    for every table in the database (or only `tables`), in O(1) catalog queries.
+    """
+    if dialect == "postgresql":
+        return _read_postgres_catalog(cursor, schema, tables)
+    return _read_sqlite_catalog(cursor, tables)
+
+
+# -----------------------------
+# SCHEMA FINGERPRINT CACHE
+# -----------------------------
+
+def schema_fingerprint(table_metadata):
+    """Stable hash of a table's columns, primary/foreign keys and indexes"""
+    payload = json.dumps(
+        {key: table_metadata.get(key) for key in ("columns", "primary_keys", "foreign_keys", "indexes")},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
 
-    # Get list of tables in SQLite
-    cursor.execute("""
-        SELECT name 
-        FROM sqlite_master 
-        WHERE type='table' AND name NOT LIKE 'sqlite_%';
-    """)
-    tables = [row[0] for row in cursor.fetchall()]
-
-    all_metadata = {}
-
-    for table in tables:
-        # Get column details
-        cursor.execute(f"PRAGMA table_info({table});")
-        columns_info = cursor.fetchall()
-
-        columns = []
-        primary_keys = []
-
-        for col in columns_info:
-            col_dict = {
-                "column_name": col[1],
-                "data_type": col[2],
-                "not_null": bool(col[3]),
-                "default_value": col[4]
-            }
-
-            if col[5] == 1:  # PK flag in SQLite
-                primary_keys.append(col[1])
-
-            columns.append(col_dict)
-
-        # Build table metadata
-        table_metadata = {
-            "table_name": table,
-            "columns": columns,
-            "primary_keys": primary_keys
+
+def _schema_cookie(cursor, dialect):
+    """SQLite bumps PRAGMA schema_version on every schema change (None elsewhere)"""
+    if dialect != "sqlite":
+        return None
+    cursor.execute("PRAGMA schema_version")
+    return cursor.fetchone()[0]
+
+
+def load_schema_cache():
+    try:
+        with open(SCHEMA_CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": 0, "schema_cookie": None, "tables": {}, "changes": []}
+
+
+def _save_schema_cache(cache):
+    os.makedirs(os.path.dirname(SCHEMA_CACHE_PATH), exist_ok=True)
+    tmp_path = SCHEMA_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, SCHEMA_CACHE_PATH)
+
+    tmp_path = SCHEMA_VERSION_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(cache["version"]))
+    os.replace(tmp_path, SCHEMA_VERSION_PATH)
+
+
+def _write_table_metadata(table, table_metadata):
+    file_path = os.path.join(METADATA_DIR, f"{table}.json")
+    with open(file_path, "w") as f:
+        json.dump(table_metadata, f, indent=4)
+
+
+def _append_changes(cache, changes):
+    """Add changes to the log, dropping the oldest versions whole once it exceeds MAX_CHANGE_LOG"""
+    log = cache["changes"] + changes
+    if len(log) > MAX_CHANGE_LOG:
+        # Never keep part of a version: changes_since() would miss the dropped half
+        last_dropped = log[len(log) - MAX_CHANGE_LOG - 1]["version"]
+        log = [change for change in log if change["version"] > last_dropped]
+        cache["log_start"] = last_dropped + 1
+    cache["changes"] = log
+
+
+def _apply_catalog(cache, all_metadata):
+    """Diff a fresh catalog read against the cache; write only changed tables. Returns changes."""
+    changes = []
+    for table, table_metadata in all_metadata.items():
+        fingerprint = schema_fingerprint(table_metadata)
+        cached = cache["tables"].get(table)
+
+        if cached is None or cached["fingerprint"] != fingerprint:
+            changes.append({"table": table, "change": "added" if cached is None else "modified"})
+            _write_table_metadata(table, table_metadata)
+        elif not os.path.exists(os.path.join(METADATA_DIR, f"{table}.json")):
+            _write_table_metadata(table, table_metadata)
+
+    for table in cache["tables"]:
+        if table not in all_metadata:
+            changes.append({"table": table, "change": "removed"})
+            try:
+                os.remove(os.path.join(METADATA_DIR, f"{table}.json"))
+            except OSError:
+                pass
+
+    if changes:
+        cache["version"] += 1
+        for change in changes:
+            change["version"] = cache["version"]
+        _append_changes(cache, changes)
+
+    version_by_table = {change["table"]: change["version"] for change in changes}
+    cache["tables"] = {
+        table: {
+            "fingerprint": schema_fingerprint(table_metadata),
+            "version": version_by_table.get(table, cache["tables"].get(table, {}).get("version", cache["version"])),
+            "metadata": table_metadata
         }
+        for table, table_metadata in all_metadata.items()
+    }
+    return changes
 
-        # Save each table metadata as a separate JSON file
-        file_path = os.path.join(METADATA_DIR, f"{table}.json")
-        with open(file_path, "w") as f:
-            json.dump(table_metadata, f, indent=4)
 
-        all_metadata[table] = table_metadata
+def extract_metadata(force=False, instrumented=False):
+    """
+    Extract table metadata and write metadata/<table>.json for tables whose
+    schema fingerprint changed since the last run.
 
-    conn.close()
-    print(f"✅ Metadata extracted for tables: {tables}")
+    On SQLite an unchanged PRAGMA schema_version skips the catalog read
+    entirely (force=True always re-reads). instrumented=True sends the
+    catalog queries to the query log and listeners. Returns {table: metadata}.
+    """
+    conn = get_connection(instrumented=instrumented)
+    cursor = conn.cursor()
+    dialect = get_dialect(conn)
+
+    with _cache_lock:
+        cache = load_schema_cache()
+        cookie = _schema_cookie(cursor, dialect)
+
+        if not force and cookie is not None and cookie == cache.get("schema_cookie") and cache["tables"]:
+            conn.close()
+            return {table: entry["metadata"] for table, entry in cache["tables"].items()}
+
+        all_metadata = read_catalog(cursor, dialect)
+        conn.close()
+
+        changes = _apply_catalog(cache, all_metadata)
+        cache["schema_cookie"] = cookie
+        _save_schema_cache(cache)
+
+    tables = list(all_metadata.keys())
+    if changes:
+        print(f"✅ Metadata extracted for tables: {tables} ({len(changes)} schema change(s), version {cache['version']})")
+    else:
+        print(f"✅ Metadata extracted for tables: {tables} (no schema changes)")
     return all_metadata
+
+
+def stored_metadata():
+    """Last extracted {table: metadata} from the schema cache (extracts first if nothing is cached)"""
+    cache = load_schema_cache()
+    if not cache["tables"]:
+        return extract_metadata()
+    return {table: entry["metadata"] for table, entry in cache["tables"].items()}
+
+
+def catalog_version():
+    """Current schema version (bumped whenever any table is added, modified or removed)"""
+    try:
+        with open(SCHEMA_VERSION_PATH, "r") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return load_schema_cache()["version"]
+
+
+def changes_since(version):
+    """
+    Schema changes after `version`: {"version", "full_refresh", "changes"}.
+
+    Each table appears once with its latest change. full_refresh=True means
+    the change log no longer reaches back to `version` and callers should
+    reload everything.
+    """
+    cache = load_schema_cache()
+    log = cache["changes"]
+
+    # log_start: oldest version whose changes are all still in the log
+    log_start = cache.get("log_start", log[0]["version"] if log else cache["version"] + 1)
+    full_refresh = version + 1 < log_start
+    latest = {}
+    for change in log:
+        if change["version"] > version:
+            latest[change["table"]] = change
+
+    return {
+        "version": cache["version"],
+        "full_refresh": full_refresh,
+        "changes": sorted(latest.values(), key=lambda change: (change["version"], change["table"]))
+    }
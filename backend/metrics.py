@@ -0,0 +1,148 @@
+import bisect
+import threading
+
+# -----------------------------
+# METRICS (Prometheus text format)
+# -----------------------------
+# Minimal counters, gauges and histograms with labels, rendered in the
+# Prometheus exposition format by render(). Recording is a dict lookup and
+# an add under a per-metric lock, so it is cheap enough for the hot path.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labelnames, labelvalues, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, labels)} {value}" for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._values.items())
+
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = 'le="' + (bound if bound == "+Inf" else repr(float(bound))) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render():
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# SHARED METRICS
+# -----------------------------
+
+HTTP_REQUESTS = Counter("datadoc_http_requests_total", "HTTP requests", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("datadoc_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("datadoc_http_requests_in_flight", "HTTP requests being served", ("route",))
+
+DB_QUERIES = Counter("datadoc_db_queries_total", "Database statements executed", ("statement",))
+DB_QUERY_LATENCY = Histogram("datadoc_db_query_duration_seconds", "Database statement latency", ("statement",))
+DB_QUERY_ERRORS = Counter("datadoc_db_query_errors_total", "Database statements that raised", ("statement",))
+
+LLM_REQUESTS = Counter("datadoc_llm_requests_total", "LLM completion requests", ("model", "status"))
+LLM_LATENCY = Histogram("datadoc_llm_request_duration_seconds", "LLM completion latency", ("model",),
+                        buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0))
+LLM_TIME_TO_FIRST_TOKEN = Histogram("datadoc_llm_time_to_first_token_seconds", "Streamed LLM time to first token",
+                                    ("model",), buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 2.0, 4.0, 8.0))
+LLM_TOKENS = Counter("datadoc_llm_tokens_total", "LLM tokens used", ("model", "kind"))
+SUMMARY_COALESCED = Counter("datadoc_summary_requests_coalesced_total",
+                            "Summary requests that waited on an identical generation instead of calling the LLM")
+SUMMARY_WAIT_TIMEOUTS = Counter("datadoc_summary_wait_timeouts_total",
+                                "Coalesced summary requests that gave up waiting")
+SUMMARY_CACHE_LOOKUPS = Counter("datadoc_summary_cache_lookups_total", "LLM summary cache lookups", ("result",))
+RESPONSE_CACHE_LOOKUPS = Counter("datadoc_response_cache_lookups_total",
+                                 "Cached endpoint responses served from the cache (hit) or rebuilt (miss)", ("result",))
+
+
+def statement_kind(sql):
+    """Leading SQL keyword (select, insert, pragma, ...) - a low-cardinality query label"""
+    stripped = sql.lstrip(" \t\r\n(")
+    return stripped.split(None, 1)[0].lower() if stripped else "unknown"
+
+
+def observe_db_query(query):
+    """Query listener (see db_connector.add_query_listener) feeding the DB_* metrics"""
+    kind = statement_kind(query["sql"])
+    DB_QUERIES.inc(kind)
+    DB_QUERY_LATENCY.observe(query["seconds"], kind)
+    if query["failed"]:
+        DB_QUERY_ERRORS.inc(kind)
@@ -0,0 +1,39 @@
+import base64
+import json
+
+# -----------------------------
+# KEYSET PAGINATION CURSORS
+# -----------------------------
+# Cursors are opaque to clients: URL-safe base64 of a small JSON object
+# holding the last key of the previous page.
+
+MAX_PAGE_SIZE = 10000
+
+
+def encode_cursor(position):
+    raw = json.dumps(position, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Position dict from encode_cursor(); ValueError for anything a client tampered with"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(position, dict) or not isinstance(position.get("after"), str):
+        raise ValueError("Invalid pagination cursor")
+    return position
+
+
+def check_page_size(limit):
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+
+def page(keys, limit):
+    """Split keys fetched with limit + 1 into (page, next_cursor)"""
+    if limit is None or len(keys) <= limit:
+        return keys, None
+    return keys[:limit], encode_cursor({"after": keys[limit - 1]})
@@ -0,0 +1,434 @@
+import datetime
+import decimal
+import math
+from statistics import NormalDist
+
+# -----------------------------
+# SINGLE-PASS TABLE PROFILER
+# -----------------------------
+# Builds ONE aggregate query per table instead of one COUNT per column.
+# The same plan works on SQLite and PostgreSQL; only the table reference
+# differs (PostgreSQL tables are schema-qualified).
+
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+SUPPORTED_MODES = ("exact", "approximate")
+
+# Approximate mode defaults
+DEFAULT_SAMPLE_FRACTION = 0.01
+DEFAULT_CONFIDENCE = 0.95
+PG_SAMPLE_METHODS = ("SYSTEM", "BERNOULLI")
+
+
+def quote_ident(name):
+    """Quote an identifier for SQLite / PostgreSQL (both use double quotes)"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def table_ref(table, dialect="sqlite", schema="public"):
+    """Return the fully-qualified, quoted table reference for a dialect"""
+    if dialect not in SUPPORTED_DIALECTS:
+        raise ValueError(f"Unsupported SQL dialect: {dialect}")
+
+    if dialect == "postgresql":
+        return f"{quote_ident(schema)}.{quote_ident(table)}"
+    return quote_ident(table)
+
+
+def param_placeholder(dialect="sqlite"):
+    """Bind-parameter marker: sqlite3 uses ?, psycopg2 uses %s"""
+    return "%s" if dialect == "postgresql" else "?"
+
+
+def find_freshness_column(meta):
+    """Pick the first date-like column (same heuristic the quality engine always used)"""
+    for col in meta["columns"]:
+        if "date" in col["column_name"] or "at" in col["column_name"]:
+            return col["column_name"]
+    return None
+
+
+def unique_index_columns(cursor, table, dialect, schema):
+    """Column sets of the table's unique indexes/constraints (partial and expression indexes excluded)"""
+    if dialect == "postgresql":
+        # Expression columns have attnum 0 and would silently drop out of the join
+        cursor.execute("""
+            SELECT array_agg(a.attname::text)
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = to_regclass(%s) AND i.indisunique
+              AND i.indpred IS NULL AND i.indexprs IS NULL
+            GROUP BY i.indexrelid
+        """, (f"{quote_ident(schema)}.{quote_ident(table)}",))
+        return [set(row[0]) for row in cursor.fetchall()]
+
+    unique_sets = []
+
+    # INTEGER PRIMARY KEY is the rowid itself and can never repeat
+    cursor.execute(f"PRAGMA table_info({quote_ident(table)})")
+    pk_columns = [(row[1], row[2]) for row in cursor.fetchall() if row[5]]
+    if len(pk_columns) == 1 and pk_columns[0][1].upper() == "INTEGER":
+        unique_sets.append({pk_columns[0][0]})
+
+    cursor.execute(f"PRAGMA index_list({quote_ident(table)})")
+    for _, index_name, unique, _, partial in cursor.fetchall():
+        if unique and not partial:
+            cursor.execute(f"PRAGMA index_info({quote_ident(index_name)})")
+            columns = [row[2] for row in cursor.fetchall()]
+            if None not in columns:  # expression columns have no name
+                unique_sets.append(set(columns))
+    return unique_sets
+
+
+def build_profile_query(table, meta, dialect="sqlite", schema="public", sample=None,
+                        where=None, params=(), watermark_column=None, unique_key=False):
+    """
+    Build a single aggregate SELECT that profiles a table in one scan.
+
+    Returns a plan dict with the SQL and the layout needed to read the
+    result row back:
+        COUNT(*), COUNT(col_1) ... COUNT(col_n),
+        [COUNT(DISTINCT pk)], [MAX(freshness_column)], [MAX(watermark_column)]
+
+    When a sample (from plan_sample()) is given, the same aggregate runs
+    over the sampled rows only. `where` (with bind `params`) restricts the
+    scan further, e.g. to rows past an incremental watermark.
+    unique_key=True (a constraint already enforces the PK) drops the
+    COUNT(DISTINCT pk), which costs a sort/hash of every key.
+    """
+    columns = [col["column_name"] for col in meta["columns"]]
+    # Composite keys are checked separately (backend/duplicates.py)
+    pk = meta["primary_keys"][0] if len(meta["primary_keys"]) == 1 and not unique_key else None
+    freshness_column = find_freshness_column(meta)
+
+    select_items = ["COUNT(*)"]
+    select_items += [f"COUNT({quote_ident(col)})" for col in columns]
+
+    if pk:
+        select_items.append(f"COUNT(DISTINCT {quote_ident(pk)})")
+    if freshness_column:
+        select_items.append(f"MAX({quote_ident(freshness_column)})")
+    if watermark_column:
+        select_items.append(f"MAX({quote_ident(watermark_column)})")
+
+    sql = (
+        "SELECT " + ",\n       ".join(select_items)
+        + "\n" + sampled_from_clause(table, dialect, schema, sample, where)
+    )
+
+    return {
+        "table": table,
+        "dialect": dialect,
+        "sql": sql,
+        "params": tuple(params),
+        "sample": sample,
+        "columns": columns,
+        "primary_key": pk,
+        "freshness_column": freshness_column,
+        "watermark_column": watermark_column,
+    }
+
+
+# -----------------------------
+# ESTIMATED ROW COUNTS (CATALOG STATISTICS)
+# -----------------------------
+# PostgreSQL: pg_stat_user_tables.n_live_tup (kept current by the stats
+# collector), else pg_class.reltuples (as of the last VACUUM/ANALYZE).
+# SQLite: sqlite_stat1, which exists once ANALYZE has been run.
+
+def _pg_estimate(live_tuples, reltuples):
+    if live_tuples:
+        return int(live_tuples)
+    if reltuples is not None and reltuples >= 0:
+        return int(reltuples)
+    return None
+
+
+def _sqlite_stat1_counts(cursor, table=None):
+    """{table: rows} from sqlite_stat1 (the first number of each stat is the row count)"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+    if not cursor.fetchone():
+        return {}
+
+    if table is None:
+        cursor.execute("SELECT tbl, stat FROM sqlite_stat1")
+    else:
+        cursor.execute("SELECT tbl, stat FROM sqlite_stat1 WHERE tbl = ?", (table,))
+
+    counts = {}
+    for tbl, stat in cursor.fetchall():
+        try:
+            rows = int(str(stat).split()[0])
+        except (ValueError, IndexError):
+            continue
+        counts[tbl] = max(rows, counts.get(tbl, 0))
+    return counts
+
+
+def estimate_row_count(cursor, table, dialect="sqlite", schema="public"):
+    """Cheap row-count estimate from catalog statistics (None if unavailable)"""
+    if dialect == "postgresql":
+        cursor.execute("""
+            SELECT s.n_live_tup, c.reltuples
+            FROM pg_class c
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = to_regclass(%s)
+        """, (f"{quote_ident(schema)}.{quote_ident(table)}",))
+        row = cursor.fetchone()
+        return _pg_estimate(row[0], row[1]) if row else None
+
+    return _sqlite_stat1_counts(cursor, table).get(table)
+
+
+def estimate_row_counts(cursor, dialect="sqlite", schema="public"):
+    """{table: estimated rows} for every table with statistics, in one catalog query"""
+    if dialect == "postgresql":
+        cursor.execute("""
+            SELECT c.relname, s.n_live_tup, c.reltuples
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+        """, (schema,))
+        estimates = {}
+        for table, live_tuples, reltuples in cursor.fetchall():
+            estimate = _pg_estimate(live_tuples, reltuples)
+            if estimate is not None:
+                estimates[table] = estimate
+        return estimates
+
+    return _sqlite_stat1_counts(cursor)
+
+
+def count_rows(cursor, table, dialect="sqlite", schema="public", count="estimated"):
+    """
+    Row count plus how it was obtained: (rows, "exact" | "estimated").
+
+    count="estimated" reads catalog statistics and only falls back to an
+    exact COUNT(*) when the table has none; count="exact" always counts.
+    """
+    if count not in ("estimated", "exact"):
+        raise ValueError(f"Unsupported count mode: {count}")
+
+    if count == "estimated":
+        estimate = estimate_row_count(cursor, table, dialect, schema)
+        if estimate is not None:
+            return estimate, "estimated"
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table_ref(table, dialect, schema)}")
+    return cursor.fetchone()[0], "exact"
+
+
+# -----------------------------
+# SAMPLING (APPROXIMATE MODE)
+# -----------------------------
+
+def plan_sample(cursor, table, dialect="sqlite", schema="public",
+                sample_fraction=None, sample_rows=None, sample_method="SYSTEM"):
+    """
+    Decide how to sample a table.
+
+    Either a fraction (0 < f <= 1) or a row budget can be given; the budget
+    wins when both are set. PostgreSQL uses TABLESAMPLE SYSTEM/BERNOULLI.
+    SQLite uses a stratified rowid sampler: the rowid range is cut into
+    step-wide strata and one random rowid is drawn from each, so only the
+    sampled rowids are touched (gaps left by deletes yield fewer rows).
+
+    The Wilson intervals attached to sampled reports assume independent
+    row-level draws. That holds for BERNOULLI and is close enough for the
+    stratified sampler, but SYSTEM picks whole pages: rows clustered on
+    disk (e.g. by load time) make its intervals too narrow.
+    """
+    if sample_fraction is None and sample_rows is None:
+        sample_fraction = DEFAULT_SAMPLE_FRACTION
+    if sample_fraction is not None and not 0 < sample_fraction <= 1:
+        raise ValueError("sample_fraction must be in (0, 1]")
+    if sample_rows is not None and sample_rows <= 0:
+        raise ValueError("sample_rows must be positive")
+
+    if dialect == "postgresql":
+        method = sample_method.upper()
+        if method not in PG_SAMPLE_METHODS:
+            raise ValueError(f"Unsupported TABLESAMPLE method: {sample_method}")
+
+        fraction = sample_fraction
+        if sample_rows is not None:
+            estimated_rows = estimate_row_count(cursor, table, dialect, schema)
+            fraction = min(1.0, sample_rows / estimated_rows) if estimated_rows else 1.0
+
+        return {"method": method, "fraction": fraction}
+
+    # SQLite: rowid bounds come straight from the rowid b-tree
+    try:
+        cursor.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table_ref(table, dialect, schema)}")
+        low, high = cursor.fetchone()
+    except Exception:
+        # WITHOUT ROWID tables: fall back to a per-row random filter
+        fraction = sample_fraction if sample_fraction is not None else DEFAULT_SAMPLE_FRACTION
+        return {"method": "random", "fraction": fraction}
+
+    if low is None:
+        return {"method": "rowid", "fraction": 1.0, "start": 0, "step": 1, "end": -1}
+
+    span = high - low + 1
+    draws = sample_rows if sample_rows is not None else math.ceil(span * sample_fraction)
+    step = max(1, span // max(1, draws))
+
+    return {
+        "method": "rowid",
+        "fraction": 1.0 / step,
+        "start": low,
+        "step": step,
+        "end": high
+    }
+
+
+def sampled_from_clause(table, dialect="sqlite", schema="public", sample=None, where=None):
+    """FROM clause for a profile query, optionally restricted to a sample and/or a filter"""
+    ref = table_ref(table, dialect, schema)
+    from_clause = f"FROM {ref}"
+    conditions = []
+
+    if sample is not None:
+        if sample["method"] in PG_SAMPLE_METHODS:
+            from_clause += f" TABLESAMPLE {sample['method']} ({sample['fraction'] * 100!r})"
+        elif sample["method"] == "random":
+            threshold = int(sample["fraction"] * 1_000_000)
+            conditions.append(f"abs(random()) % 1000000 < {threshold}")
+        else:
+            conditions.append(
+                f"rowid IN ("
+                f"WITH RECURSIVE pick(rid) AS ("
+                f"SELECT {int(sample['start'])} "
+                f"UNION ALL SELECT rid + {int(sample['step'])} FROM pick "
+                f"WHERE rid + {int(sample['step'])} <= {int(sample['end'])}"
+                f") SELECT rid + abs(random() % {int(sample['step'])}) FROM pick)"
+            )
+
+    if where:
+        conditions.append(f"({where})")
+
+    if conditions:
+        from_clause += " WHERE " + " AND ".join(conditions)
+    return from_clause
+
+
+def wilson_interval(successes, trials, confidence=DEFAULT_CONFIDENCE):
+    """Wilson score interval for a proportion, returned as percentages"""
+    if trials <= 0:
+        return [0.0, 100.0]
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+
+    return [round(max(0.0, centre - margin) * 100, 2), round(min(1.0, centre + margin) * 100, 2)]
+
+
+def to_json_value(value):
+    """Convert DB driver values (dates, Decimals) to something json.dump accepts"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def parse_profile_row(plan, row, confidence=DEFAULT_CONFIDENCE):
+    """
+    Turn the single result row of build_profile_query() into a quality report.
+
+    For sampled plans, completeness is measured on the sample, every column
+    gets a confidence interval and total_rows is scaled up from the sample.
+    Duplicates and last_updated then only reflect the sampled rows.
+    """
+    values = list(row)
+    total_rows = values[0] or 0
+    position = 1
+
+    column_quality = {}
+    for col_name in plan["columns"]:
+        non_null_count = values[position] or 0
+        position += 1
+
+        completeness = 0
+        if total_rows > 0:
+            completeness = round((non_null_count / total_rows) * 100, 2)
+
+        column_quality[col_name] = {
+            "non_null_count": non_null_count,
+            "completeness_percent": completeness
+        }
+        if plan["sample"] is not None:
+            column_quality[col_name]["completeness_ci_percent"] = wilson_interval(
+                non_null_count, total_rows, confidence
+            )
+
+    # Surplus rows sharing a PK value: non-null PK rows minus distinct PK values.
+    # How many distinct keys repeat needs a GROUP BY (backend/duplicates.py),
+    # so it is None here whenever there are any.
+    duplicate_rows = 0
+    if plan["primary_key"]:
+        distinct_keys = values[position] or 0
+        position += 1
+        duplicate_rows = column_quality[plan["primary_key"]]["non_null_count"] - distinct_keys
+
+    last_updated = None
+    if plan["freshness_column"]:
+        last_updated = to_json_value(values[position])
+        position += 1
+
+    report = {
+        "mode": "exact",
+        "total_rows": total_rows,
+        "row_count_type": "exact",
+        "column_completeness": column_quality,
+        "duplicate_primary_keys": 0 if duplicate_rows == 0 else None,
+        "duplicate_rows": duplicate_rows,
+        "freshness_column": plan["freshness_column"],
+        "last_updated": last_updated
+    }
+
+    if plan["watermark_column"]:
+        report["watermark"] = {
+            "column": plan["watermark_column"],
+            "value": to_json_value(values[position])
+        }
+
+    sample = plan["sample"]
+    if sample is not None:
+        report["mode"] = "approximate"
+        report["row_count_type"] = "estimated"
+        report["total_rows"] = round(total_rows / sample["fraction"]) if sample["fraction"] else total_rows
+        report["sample"] = {
+            "method": sample["method"],
+            "fraction": sample["fraction"],
+            "sample_rows": total_rows,
+            "confidence": confidence
+        }
+
+    return report
+
+
+def profile_table(cursor, table, meta, dialect="sqlite", schema="public", mode="exact",
+                  sample_fraction=None, sample_rows=None, sample_method="SYSTEM",
+                  confidence=DEFAULT_CONFIDENCE, where=None, params=(), watermark_column=None):
+    """Profile one table with a single aggregate query (optionally over a sample or a filter)"""
+    if mode not in SUPPORTED_MODES:
+        raise ValueError(f"Unsupported quality mode: {mode}")
+
+    sample = None
+    if mode == "approximate":
+        sample = plan_sample(cursor, table, dialect, schema,
+                             sample_fraction, sample_rows, sample_method)
+
+    pks = meta["primary_keys"]
+    unique_key = len(pks) == 1 and {pks[0]} in unique_index_columns(cursor, table, dialect, schema)
+    plan = build_profile_query(table, meta, dialect, schema, sample,
+                               where=where, params=params, watermark_column=watermark_column,
+                               unique_key=unique_key)
+    cursor.execute(plan["sql"], plan["params"])
+    return parse_profile_row(plan, cursor.fetchone(), confidence)
@@ -1,89 +1,252 @@
+import datetime
 import json
 import os
-from backend.db_connector import get_connection
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from backend.config import METADATA_DIR
+from backend.db_connector import (
+    ConnectionPool, get_connection, get_dialect, set_statement_timeout, clear_statement_timeout
+)
+from backend.duplicates import find_duplicate_keys
+from backend.incremental import profile_table_incremental
 from backend.metadata_extractor import extract_metadata
+from backend.profiler import estimate_row_counts, profile_table
+from backend.quality_history import record_run
+from backend.sketches import refresh_table_sketches
+
+
+# Parallel execution defaults (override per call or via environment)
+DEFAULT_WORKERS = int(os.getenv("QUALITY_WORKERS", "4"))
+DEFAULT_TABLE_TIMEOUT = float(os.getenv("QUALITY_TABLE_TIMEOUT", "0")) or None
+
+
+def load_quality_report(table):
+    """Previously written metadata/<table>_quality.json (None if missing or unreadable)"""
+    quality_file = os.path.join(METADATA_DIR, f"{table}_quality.json")
+    try:
+        with open(quality_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def check_duplicate_keys(conn, table, meta, table_quality, dialect="sqlite", schema="public"):
+    """
+    Exact reports only: for composite keys, or a single key the aggregate
+    flagged, fill in duplicate_primary_keys (distinct keys that repeat) and
+    duplicate_rows (surplus rows) from backend/duplicates.py.
+    """
+    pks = meta["primary_keys"]
+    if table_quality["mode"] != "exact" or not pks or (len(pks) == 1 and not table_quality["duplicate_rows"]):
+        return
+    duplicate_check = find_duplicate_keys(
+        conn, table, pks, dialect, schema, row_count=table_quality["total_rows"]
+    )
+    table_quality["duplicate_primary_keys"] = duplicate_check["duplicate_keys"]
+    table_quality["duplicate_rows"] = duplicate_check["duplicate_rows"]
+    table_quality["duplicate_key_check"] = duplicate_check
+
+
+def _profile_one(pool, table, meta, table_timeout, profile_options, incremental=False, sketches=False):
+    """Profile a single table on a pooled connection and write its JSON report"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        dialect = get_dialect(conn)
+        if table_timeout:
+            set_statement_timeout(conn, table_timeout)
+        try:
+            # Row count, per-column completeness, PK duplicates and freshness
+            # all come from ONE aggregate scan (see backend/profiler.py)
+            if profile_options.get("mode", "exact") == "exact":
+                # Exact runs always record a watermark so the next run can be incremental
+                previous = load_quality_report(table) if incremental else None
+                table_quality = profile_table_incremental(
+                    cursor, table, meta, previous, dialect, force_full=not incremental
+                )
+            else:
+                table_quality = profile_table(cursor, table, meta, dialect, **profile_options)
 
+            check_duplicate_keys(conn, table, meta, table_quality, dialect)
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-METADATA_DIR = os.path.join(BASE_DIR, "metadata")
+            if sketches:
+                # Distinct counts, min/max, quantiles and histograms (backend/sketches.py)
+                table_quality["column_statistics"] = refresh_table_sketches(
+                    conn, table, meta, table_quality, dialect
+                )
+        finally:
+            cursor.close()
+            # End the read transaction first: after a PostgreSQL timeout it is
+            # aborted and would reject the reset (hiding the original error)
+            conn.rollback()
+            if table_timeout:
+                clear_statement_timeout(conn)
+
+    # Write to JSON file (profiled_at lets readers decide whether it is fresh enough)
+    table_quality["profiled_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    quality_file = os.path.join(METADATA_DIR, f"{table}_quality.json")
+    with open(quality_file, "w") as f:
+        json.dump(table_quality, f, indent=4)
+
+    return table_quality
+
+
+def profile_tables(metadata, workers=DEFAULT_WORKERS, table_timeout=DEFAULT_TABLE_TIMEOUT,
+                   on_progress=None, incremental=False, sketches=False, cancel_event=None, instrumented=False,
+                   **profile_options):
+    """
+    Profile many tables concurrently over a bounded connection pool.
+
+    Each worker borrows its own pooled connection. A table that fails or
+    exceeds table_timeout (seconds) is recorded in `errors` and does not
+    stop the run. on_progress, if given, is called from the calling thread
+    as each table finishes with a dict like:
+        {"table", "status": "done"|"failed", "completed", "total", "quality"|"error"}
+
+    With incremental=True (exact mode only) each table profiles just the
+    rows past its stored watermark; see backend/incremental.py.
+    sketches=True also refreshes each table's mergeable column sketches.
+
+    Setting cancel_event (a threading.Event) stops the run: tables not yet
+    started are skipped and recorded in `errors` as "cancelled"; tables
+    already being profiled finish.
+
+    instrumented=True routes the pooled connections through the query log
+    and listeners (backend_server does so for its DB metrics).
+
+    Returns (results, errors).
+    """
+    if incremental and profile_options.get("mode", "exact") != "exact":
+        raise ValueError("Incremental refresh is only supported in exact mode")
+
+    workers = max(1, int(workers))
+    pool = ConnectionPool(max_size=workers, instrumented=instrumented)
+    results = {}
+    errors = {}
+    total = len(metadata)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quality") as executor:
+            futures = {
+                executor.submit(_profile_one, pool, table, meta, table_timeout, profile_options, incremental, sketches): table
+                for table, meta in metadata.items()
+            }
 
-def analyze_quality():
+            for future in as_completed(futures):
+                table = futures[future]
+                if future.cancelled():
+                    errors[table] = "cancelled"
+                    continue
+
+                event = {"table": table, "completed": len(results) + len(errors) + 1, "total": total}
+                try:
+                    results[table] = future.result()
+                    event.update(status="done", quality=results[table])
+                except Exception as e:
+                    errors[table] = str(e)
+                    event.update(status="failed", error=str(e))
+                    print(f"❌ Quality analysis failed for {table}: {e}")
+
+                if on_progress:
+                    on_progress(event)
+
+                if cancel_event is not None and cancel_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+    finally:
+        pool.close_all()
+
+    return results, errors
+
+
+def analyze_quality(mode="exact", sample_fraction=None, sample_rows=None, sample_method="SYSTEM",
+                    workers=DEFAULT_WORKERS, table_timeout=DEFAULT_TABLE_TIMEOUT, on_progress=None,
+                    incremental=False, sketches=False, record_history=True, cancel_event=None,
+                    instrumented=False):
+    """
+    Profile every table and write metadata/<table>_quality.json.
+
+    mode="exact" counts every row. mode="approximate" profiles a sample
+    (sample_fraction of the table, or about sample_rows rows) and attaches
+    a confidence interval to each completeness percentage.
+
+    incremental=True profiles only rows past each table's stored
+    watermark and merges them into the previous report, falling back to a
+    full rescan when deletes/updates are detected.
+
+    sketches=True adds per-column distinct-count estimates, min/max,
+    quantiles and histograms ("column_statistics") from mergeable sketches
+    stored under metadata/sketches/.
+
+    Tables are profiled by `workers` threads; failed tables are skipped
+    (and reported through on_progress) rather than aborting the run.
+    cancel_event stops the run early and instrumented=True reports the
+    run's queries to the query log (see profile_tables).
+
+    Every completed run is also appended to the quality history store
+    (backend/quality_history.py) unless record_history=False.
+
+    Returns (results, errors): errors maps each skipped table to its reason.
+    """
+    # Make sure latest metadata exists
+    metadata = extract_metadata(instrumented=instrumented)
+
+    quality_results, errors = profile_tables(
+        metadata, workers=workers, table_timeout=table_timeout, on_progress=on_progress,
+        incremental=incremental, sketches=sketches, cancel_event=cancel_event,
+        instrumented=instrumented, mode=mode,
+        sample_fraction=sample_fraction, sample_rows=sample_rows, sample_method=sample_method
+    )
+
+    # A cancelled run only covers some tables; it would skew the trends
+    cancelled = cancel_event is not None and cancel_event.is_set()
+    if record_history and quality_results and not cancelled:
+        record_run(quality_results, mode)
+
+    if errors:
+        print(f"⚠️ Data quality analysis ({mode}) skipped {len(errors)} table(s): {sorted(errors)}")
+    print(f"✅ Data quality analysis ({mode}) completed for {len(quality_results)} tables.")
+    return quality_results, errors
+
+
+# -----------------------------
+# INSTANT SNAPSHOT
+# -----------------------------
+
+def stored_quality_tables():
+    return [
+        f.replace(".json", "")
+        for f in os.listdir(METADATA_DIR)
+        if f.endswith(".json") and not f.endswith("_quality.json")
+    ]
+
+
+def quality_snapshot():
+    """
+    Instant quality view for dashboards: the last stored reports with row
+    counts replaced by catalog-statistics estimates (one catalog query, no
+    table scans). Nothing is written to disk; exact numbers come from a
+    refresh job (analyze_quality). Tables never profiled get a placeholder
+    report with mode "estimated".
+    """
     conn = get_connection()
     cursor = conn.cursor()
-
-    # Make sure latest metadata exists
-    metadata = extract_metadata()
-
-    quality_results = {}
-
-    for table, meta in metadata.items():
-        table_quality = {}
-
-        # 1) Total row count
-        cursor.execute(f"SELECT COUNT(*) FROM {table}")
-        total_rows = cursor.fetchone()[0]
-        table_quality["total_rows"] = total_rows
-
-        # 2) Column-level completeness
-        column_quality = {}
-
-        for col in meta["columns"]:
-            col_name = col["column_name"]
-
-            cursor.execute(f"SELECT COUNT({col_name}) FROM {table}")
-            non_null_count = cursor.fetchone()[0]
-
-            completeness = 0
-            if total_rows > 0:
-                completeness = round((non_null_count / total_rows) * 100, 2)
-
-            column_quality[col_name] = {
-                "non_null_count": non_null_count,
-                "completeness_percent": completeness
-            }
-
-        table_quality["column_completeness"] = column_quality
-
-        # 3) Primary key health (duplicates)
-        pk = meta["primary_keys"][0] if meta["primary_keys"] else None
-        duplicate_keys = 0
-
-        if pk:
-            cursor.execute(f"""
-                SELECT COUNT(*) FROM (
-                    SELECT {pk}
-                    FROM {table}
-                    GROUP BY {pk}
-                    HAVING COUNT(*) > 1
-                )
-            """)
-            duplicate_keys = cursor.fetchone()[0]
-
-        table_quality["duplicate_primary_keys"] = duplicate_keys
-
-        # 4) Simple freshness check (if a date-like column exists)
-        freshness_column = None
-        for col in meta["columns"]:
-            if "date" in col["column_name"] or "at" in col["column_name"]:
-                freshness_column = col["column_name"]
-                break
-
-        last_updated = None
-        if freshness_column:
-            cursor.execute(f"SELECT MAX({freshness_column}) FROM {table}")
-            last_updated = cursor.fetchone()[0]
-
-        table_quality["freshness_column"] = freshness_column
-        table_quality["last_updated"] = last_updated
-
-        # Save per-table quality report
-        quality_results[table] = table_quality
-
-        # Write to JSON file
-        quality_file = os.path.join(METADATA_DIR, f"{table}_quality.json")
-        with open(quality_file, "w") as f:
-            json.dump(table_quality, f, indent=4)
-
+    estimates = estimate_row_counts(cursor, get_dialect(conn))
     conn.close()
-    print("✅ Data quality analysis completed for all tables.")
-    return quality_results
+
+    snapshot = {}
+    for table in sorted(set(stored_quality_tables()) | set(estimates)):
+        report = load_quality_report(table) or {
+            "mode": "estimated",
+            "total_rows": None,
+            "row_count_type": None,
+            "column_completeness": {},
+            "duplicate_primary_keys": None,
+            "duplicate_rows": None,
+            "freshness_column": None,
+            "last_updated": None
+        }
+        if table in estimates:
+            report["total_rows"] = estimates[table]
+            report["row_count_type"] = "estimated"
+        snapshot[table] = report
+
+    return snapshot
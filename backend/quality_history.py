@@ -0,0 +1,275 @@
+import datetime
+import os
+import sqlite3
+import threading
+from backend.config import METADATA_DIR
+
+# -----------------------------
+# QUALITY HISTORY STORE
+# -----------------------------
+# Append-only SQLite database of every quality run, so trends survive the
+# overwrite of metadata/<table>_quality.json. Snapshot tables are
+# WITHOUT ROWID and clustered on (table, [column,] recorded_at), which makes
+# a time-series read for one table a single index range scan. Daily
+# rollups are maintained on write so day/month buckets over years of
+# hourly snapshots read ~24x fewer rows.
+
+HISTORY_DB_PATH = os.getenv("QUALITY_HISTORY_DB", os.path.join(METADATA_DIR, "quality_history.db"))
+
+# Length of the ISO-8601 prefix that identifies each bucket
+BUCKETS = {"hour": 13, "day": 10, "month": 7}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quality_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at TEXT NOT NULL,
+    mode TEXT,
+    table_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS table_snapshots (
+    table_name TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    mode TEXT,
+    total_rows INTEGER,
+    duplicate_primary_keys INTEGER,
+    last_updated TEXT,
+    PRIMARY KEY (table_name, recorded_at, run_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS column_snapshots (
+    table_name TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    non_null_count INTEGER,
+    completeness_percent REAL,
+    PRIMARY KEY (table_name, column_name, recorded_at, run_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS table_daily (
+    table_name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    total_rows_sum REAL NOT NULL,
+    PRIMARY KEY (table_name, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS column_daily (
+    table_name TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    completeness_sum REAL NOT NULL,
+    non_null_sum REAL NOT NULL,
+    PRIMARY KEY (table_name, column_name, day)
+) WITHOUT ROWID;
+"""
+
+
+# Database files already switched to WAL with the schema in place (per process)
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def get_history_connection(path=None):
+    path = path or HISTORY_DB_PATH
+    conn = sqlite3.connect(path)
+    if path not in _initialized_paths:
+        # journal_mode=WAL is persistent and the schema is IF NOT EXISTS: once per file is enough
+        with _init_lock:
+            if path not in _initialized_paths:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                _initialized_paths.add(path)
+    return conn
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+def record_run(quality_results, mode="exact", recorded_at=None, path=None):
+    """Append one snapshot per table and column for a quality run, in a single transaction"""
+    recorded_at = recorded_at or _now()
+    conn = get_history_connection(path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO quality_runs (recorded_at, mode, table_count) VALUES (?, ?, ?)",
+                (recorded_at, mode, len(quality_results))
+            )
+            run_id = cursor.lastrowid
+
+            conn.executemany(
+                "INSERT INTO table_snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (table, recorded_at, run_id, quality.get("mode", mode), quality["total_rows"],
+                     quality.get("duplicate_primary_keys"),
+                     None if quality.get("last_updated") is None else str(quality["last_updated"]))
+                    for table, quality in quality_results.items()
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO column_snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (table, column, recorded_at, run_id, metrics["non_null_count"],
+                     metrics["completeness_percent"])
+                    for table, quality in quality_results.items()
+                    for column, metrics in quality["column_completeness"].items()
+                ]
+            )
+
+            # Daily rollups (averages = sum / samples)
+            day = recorded_at[:BUCKETS["day"]]
+            conn.executemany(
+                """INSERT INTO table_daily VALUES (?, ?, 1, ?)
+                   ON CONFLICT (table_name, day) DO UPDATE SET
+                       samples = samples + 1,
+                       total_rows_sum = total_rows_sum + excluded.total_rows_sum""",
+                [(table, day, quality["total_rows"] or 0) for table, quality in quality_results.items()]
+            )
+            conn.executemany(
+                """INSERT INTO column_daily VALUES (?, ?, ?, 1, ?, ?)
+                   ON CONFLICT (table_name, column_name, day) DO UPDATE SET
+                       samples = samples + 1,
+                       completeness_sum = completeness_sum + excluded.completeness_sum,
+                       non_null_sum = non_null_sum + excluded.non_null_sum""",
+                [
+                    (table, column, day, metrics["completeness_percent"] or 0, metrics["non_null_count"] or 0)
+                    for table, quality in quality_results.items()
+                    for column, metrics in quality["column_completeness"].items()
+                ]
+            )
+    finally:
+        conn.close()
+
+    return run_id
+
+
+def _range_filter(since, until, column="recorded_at"):
+    """
+    AND-ed since/until conditions; the daily rollup compares whole days.
+
+    `until` is inclusive of everything it prefixes (until=2024-02-01T02 keeps
+    the whole hour), so it becomes `< next prefix` rather than `<= until`.
+    """
+    if column == "day":
+        since = since and since[:BUCKETS["day"]]
+        until = until and until[:BUCKETS["day"]]
+
+    clauses, params = [], []
+    if since:
+        clauses.append(f"{column} >= ?")
+        params.append(since)
+    if until:
+        clauses.append(f"{column} < ?")
+        params.append(until[:-1] + chr(ord(until[-1]) + 1))
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def _bucket_length(bucket):
+    if bucket is None:
+        return None
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket} (use one of {sorted(BUCKETS)})")
+    return BUCKETS[bucket]
+
+
+def row_count_series(table, since=None, until=None, bucket=None, limit=None, path=None):
+    """
+    [{"recorded_at", "total_rows"}] for a table, oldest first.
+
+    With a bucket ("hour", "day", "month") points are averaged per bucket;
+    with a limit only the most recent `limit` points are returned.
+    """
+    length = _bucket_length(bucket)
+    daily = bool(length) and length <= BUCKETS["day"]
+    range_sql, params = _range_filter(since, until, "day" if daily else "recorded_at")
+
+    if daily:
+        # Day/month buckets come from the daily rollup
+        sql = (
+            f"SELECT substr(day, 1, {length}) AS bucket, SUM(total_rows_sum) / SUM(samples) "
+            f"FROM table_daily WHERE table_name = ?{range_sql} "
+            f"GROUP BY bucket ORDER BY bucket DESC"
+        )
+    elif length:
+        sql = (
+            f"SELECT substr(recorded_at, 1, {length}) AS bucket, AVG(total_rows) "
+            f"FROM table_snapshots WHERE table_name = ?{range_sql} "
+            f"GROUP BY bucket ORDER BY bucket DESC"
+        )
+    else:
+        sql = (
+            f"SELECT recorded_at, total_rows FROM table_snapshots "
+            f"WHERE table_name = ?{range_sql} ORDER BY recorded_at DESC"
+        )
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+
+    conn = get_history_connection(path)
+    try:
+        rows = conn.execute(sql, [table] + params).fetchall()
+    finally:
+        conn.close()
+
+    return [{"recorded_at": recorded_at, "total_rows": total_rows} for recorded_at, total_rows in reversed(rows)]
+
+
+def completeness_series(table, columns=None, since=None, until=None, bucket=None, limit=None, path=None):
+    """{column: [{"recorded_at", "completeness_percent", "non_null_count"}]}, oldest first (see row_count_series)"""
+    length = _bucket_length(bucket)
+    daily = bool(length) and length <= BUCKETS["day"]
+    range_sql, params = _range_filter(since, until, "day" if daily else "recorded_at")
+
+    column_sql = ""
+    if columns:
+        column_sql = " AND column_name IN (" + ", ".join("?" for _ in columns) + ")"
+        params = list(columns) + params
+
+    if daily:
+        sql = (
+            f"SELECT column_name, substr(day, 1, {length}) AS point, "
+            f"SUM(completeness_sum) / SUM(samples) AS completeness, SUM(non_null_sum) / SUM(samples) AS non_null "
+            f"FROM column_daily WHERE table_name = ?{column_sql}{range_sql} "
+            f"GROUP BY column_name, point"
+        )
+    elif length:
+        sql = (
+            f"SELECT column_name, substr(recorded_at, 1, {length}) AS point, "
+            f"AVG(completeness_percent) AS completeness, AVG(non_null_count) AS non_null "
+            f"FROM column_snapshots WHERE table_name = ?{column_sql}{range_sql} "
+            f"GROUP BY column_name, point"
+        )
+    else:
+        sql = (
+            f"SELECT column_name, recorded_at AS point, completeness_percent AS completeness, "
+            f"non_null_count AS non_null "
+            f"FROM column_snapshots WHERE table_name = ?{column_sql}{range_sql}"
+        )
+
+    if limit:
+        # Most recent `limit` points per column, cut in SQL rather than after fetching them all
+        sql = (
+            f"SELECT column_name, point, completeness, non_null FROM ("
+            f"SELECT *, ROW_NUMBER() OVER (PARTITION BY column_name ORDER BY point DESC) AS point_rank "
+            f"FROM ({sql})) WHERE point_rank <= {int(limit)}"
+        )
+    sql += " ORDER BY column_name, point"
+
+    conn = get_history_connection(path)
+    try:
+        rows = conn.execute(sql, [table] + params).fetchall()
+    finally:
+        conn.close()
+
+    series = {}
+    for column, recorded_at, completeness, non_null_count in rows:
+        series.setdefault(column, []).append({
+            "recorded_at": recorded_at,
+            "completeness_percent": round(completeness, 2) if completeness is not None else None,
+            "non_null_count": non_null_count
+        })
+    return series
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+# -----------------------------
+# VERSIONED RESPONSE CACHE
+# -----------------------------
+# Serialized API responses keyed by (scope, scope version, request). The
+# refresh endpoints bump a scope's version, which drops its entries so the
+# next request rebuilds them. ETags are content hashes: clients revalidate
+# with If-None-Match and still get a 304 when a rebuilt response is identical.
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+DEFAULT_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Upper bound on staleness for data that changes without a refresh
+DEFAULT_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+
+def make_etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def negotiate_encoding(accept_encoding):
+    """Best Content-Encoding we can produce for an Accept-Encoding header (None = identity)"""
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            offered[name.strip().lower()] = quality
+
+    available = ["br", "gzip"] if brotli is not None else ["gzip"]
+    quality = {encoding: offered.get(encoding, offered.get("*", 0)) for encoding in available}
+    candidates = [encoding for encoding in available if quality[encoding] > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda encoding: quality[encoding])
+
+
+def encode_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value covers `etag` (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+class ResponseCache:
+    """Thread-safe LRU of (body, etag) bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, scope):
+        with self._lock:
+            return self._versions.get(scope, 0)
+
+    def bump(self, *scopes):
+        """Invalidate everything cached under these scopes"""
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+            for key in [key for key in self._entries if set(key[0]) & set(scopes)]:
+                self._remove(key)
+
+    def key(self, scopes, *parts):
+        """Cache key for a response that depends on one scope or a tuple of scopes"""
+        scopes = (scopes,) if isinstance(scopes, str) else tuple(scopes)
+        with self._lock:
+            versions = tuple(self._versions.get(scope, 0) for scope in scopes)
+        return (scopes, versions) + parts
+
+    def get(self, key):
+        """(body, etag) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and time.monotonic() - entry[2] > self.ttl):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, body, etag=None):
+        """Store a serialized body; returns its ETag. Bodies larger than max_bytes are not cached."""
+        etag = etag or make_etag(body)
+        if len(body) > self.max_bytes:
+            return etag
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, etag, time.monotonic())
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return etag
+
+    def _remove(self, key):
+        body = self._entries.pop(key)[0]
+        self._bytes -= len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "misses": self.misses, "versions": dict(self._versions)}
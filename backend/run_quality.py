@@ -1,4 +1,6 @@
 from quality_engine import analyze_quality
 
-results = analyze_quality()
+results, errors = analyze_quality()
 print(results)
+if errors:
+    print(errors)
@@ -0,0 +1,50 @@
+import threading
+
+# -----------------------------
+# SINGLE-FLIGHT CALLS
+# -----------------------------
+# Concurrent callers asking for the same key share one execution: the
+# first becomes the leader and does the work, the rest wait (with a
+# timeout) for its result or exception. Nothing is remembered afterwards;
+# caching finished results is the caller's job.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Timed out after {timeout:g}s waiting for an identical request in progress")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """(call, leader). The leader must end the call with finish(); others call call.wait(timeout)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,470 @@
+import base64
+import decimal
+import hashlib
+import json
+import math
+import os
+import random
+from backend.config import METADATA_DIR
+from backend.db_connector import open_streaming_cursor
+from backend.profiler import param_placeholder, quote_ident, sampled_from_clause, to_json_value
+
+# -----------------------------
+# MERGEABLE COLUMN SKETCHES
+# -----------------------------
+# Distinct counts (HyperLogLog), quantiles (KLL), fixed-bin histograms and
+# min/max, built in one streaming pass. Every sketch can be merged with
+# another sketch of the same column, so partitions and incremental
+# refreshes combine without rescanning old rows.
+
+SKETCH_DIR = os.path.join(METADATA_DIR, "sketches")
+
+HLL_PRECISION = 12          # 4096 registers, ~1.6% standard error
+KLL_K = 200                 # ~1% rank error
+HISTOGRAM_BINS = 20
+HISTOGRAM_REBUILD_FRACTION = 0.05   # rebuild once this share of values falls outside the bins
+REPORTED_QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+NUMERIC_TYPE_MARKERS = ("INT", "REAL", "FLOA", "DOUB", "NUMERIC", "DECIMAL")
+
+
+def _hash64(value):
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _as_number(value):
+    """Float value for numeric sketches, or None for non-numbers (bools excluded)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return float(value)
+    return None
+
+
+def is_numeric_type(data_type):
+    data_type = str(data_type or "").upper()
+    return any(marker in data_type for marker in NUMERIC_TYPE_MARKERS)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-count sketch; merge = element-wise register max"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        remaining = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = min(64 - remaining.bit_length() + 1, 64 - self.precision + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.m and zeros:
+            # Small-range correction (linear counting)
+            return self.m * math.log(self.m / zeros)
+        return raw
+
+    def to_dict(self):
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(bytes(self.registers)).decode("ascii")
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["precision"], base64.b64decode(data["registers"]))
+
+
+class KLLSketch:
+    """KLL quantile sketch; items at level h stand for 2**h original values"""
+
+    def __init__(self, k=KLL_K, levels=None, count=0):
+        self.k = k
+        self.levels = levels if levels is not None else [[]]
+        self.count = count
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[level])
+                # An odd item out stays behind so total weight is preserved
+                leftover = [items.pop()] if len(items) % 2 else []
+                offset = random.getrandbits(1)
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = leftover
+            level += 1
+
+    def add(self, value):
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.levels)
+            for value in items
+        )
+        if not weighted:
+            return None
+
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self):
+        return {"k": self.k, "count": self.count, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["k"], [list(items) for items in data["levels"]], data["count"])
+
+
+class Histogram:
+    """Fixed-bin histogram over [low, high]; values outside land in underflow/overflow"""
+
+    def __init__(self, low, high, bins=HISTOGRAM_BINS, counts=None, underflow=0, overflow=0):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.counts = counts if counts is not None else [0] * bins
+        self.underflow = underflow
+        self.overflow = overflow
+
+    def add(self, value):
+        if value < self.low:
+            self.underflow += 1
+        elif value > self.high:
+            self.overflow += 1
+        elif self.high == self.low:
+            self.counts[0] += 1
+        else:
+            index = int((value - self.low) / (self.high - self.low) * self.bins)
+            self.counts[min(index, self.bins - 1)] += 1
+
+    def merge(self, other):
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def out_of_range_fraction(self):
+        total = sum(self.counts) + self.underflow + self.overflow
+        return (self.underflow + self.overflow) / total if total else 0.0
+
+    def to_dict(self):
+        return {
+            "low": self.low,
+            "high": self.high,
+            "bins": self.bins,
+            "counts": self.counts,
+            "underflow": self.underflow,
+            "overflow": self.overflow
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["low"], data["high"], data["bins"], data["counts"],
+                   data["underflow"], data["overflow"])
+
+
+class ColumnSketch:
+    """All sketches for one column: count/nulls, min/max, HLL, and KLL + histogram for numbers"""
+
+    def __init__(self, numeric=False, bounds=None):
+        self.numeric = numeric
+        self.count = 0
+        self.null_count = 0
+        self.min_value = None
+        self.max_value = None
+        self.hll = HyperLogLog()
+        self.kll = KLLSketch() if numeric else None
+        self.histogram = Histogram(*bounds) if numeric and bounds and None not in bounds else None
+
+    def _track_range(self, value):
+        try:
+            if self.min_value is None or value < self.min_value:
+                self.min_value = value
+            if self.max_value is None or value > self.max_value:
+                self.max_value = value
+        except TypeError:
+            # Mixed types in a dynamically-typed SQLite column
+            pass
+
+    def add(self, value):
+        self.count += 1
+        if value is None:
+            self.null_count += 1
+            return
+
+        value = to_json_value(value)
+        self._track_range(value)
+        self.hll.add(value)
+
+        number = _as_number(value)
+        if number is not None and self.kll is not None:
+            self.kll.add(number)
+            if self.histogram is not None:
+                self.histogram.add(number)
+
+    def merge(self, other):
+        self.count += other.count
+        self.null_count += other.null_count
+        for value in (other.min_value, other.max_value):
+            if value is not None:
+                self._track_range(value)
+        self.hll.merge(other.hll)
+        if self.kll is not None and other.kll is not None:
+            self.kll.merge(other.kll)
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram.merge(other.histogram)
+        elif self.histogram is None:
+            self.histogram = other.histogram
+        return self
+
+    def summary(self):
+        summary = {
+            "distinct_estimate": int(round(self.hll.estimate())) if self.count > self.null_count else 0,
+            "min": self.min_value,
+            "max": self.max_value
+        }
+        if self.kll is not None and self.kll.count:
+            summary["quantiles"] = {
+                f"p{int(q * 100):02d}": self.kll.quantile(q) for q in REPORTED_QUANTILES
+            }
+        if self.histogram is not None:
+            summary["histogram"] = self.histogram.to_dict()
+        return summary
+
+    def to_dict(self):
+        return {
+            "numeric": self.numeric,
+            "count": self.count,
+            "null_count": self.null_count,
+            "min": self.min_value,
+            "max": self.max_value,
+            "hll": self.hll.to_dict(),
+            "kll": self.kll.to_dict() if self.kll is not None else None,
+            "histogram": self.histogram.to_dict() if self.histogram is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["numeric"])
+        sketch.count = data["count"]
+        sketch.null_count = data["null_count"]
+        sketch.min_value = data["min"]
+        sketch.max_value = data["max"]
+        sketch.hll = HyperLogLog.from_dict(data["hll"])
+        sketch.kll = KLLSketch.from_dict(data["kll"]) if data["kll"] else None
+        sketch.histogram = Histogram.from_dict(data["histogram"]) if data["histogram"] else None
+        return sketch
+
+
+# -----------------------------
+# BUILDING / MERGING TABLE SKETCHES
+# -----------------------------
+
+def _numeric_bounds(cursor, table, numeric_columns, dialect, schema, where, params):
+    """MIN/MAX of every numeric column in one aggregate (histogram bin edges)"""
+    if not numeric_columns:
+        return {}
+
+    select_items = []
+    for col in numeric_columns:
+        select_items += [f"MIN({quote_ident(col)})", f"MAX({quote_ident(col)})"]
+    cursor.execute(
+        "SELECT " + ", ".join(select_items) + " " + sampled_from_clause(table, dialect, schema, where=where),
+        params
+    )
+    row = cursor.fetchone()
+
+    bounds = {}
+    for i, col in enumerate(numeric_columns):
+        low, high = _as_number(row[2 * i]), _as_number(row[2 * i + 1])
+        if low is not None and high is not None:
+            bounds[col] = (low, high)
+    return bounds
+
+
+def build_table_sketches(conn, table, meta, dialect="sqlite", schema="public",
+                         where=None, params=(), bounds=None, batch_size=5000):
+    """
+    Stream a table (or the rows matching `where`) once and sketch every column.
+
+    `bounds` fixes histogram bin edges per numeric column; pass the bounds of
+    existing sketches when building a delta that will be merged into them.
+    """
+    columns = [col["column_name"] for col in meta["columns"]]
+    numeric = {col["column_name"]: is_numeric_type(col.get("data_type")) for col in meta["columns"]}
+
+    if bounds is None:
+        cursor = conn.cursor()
+        bounds = _numeric_bounds(cursor, table, [c for c in columns if numeric[c]],
+                                 dialect, schema, where, params)
+        cursor.close()
+
+    sketches = {col: ColumnSketch(numeric[col], bounds.get(col)) for col in columns}
+
+    cursor = open_streaming_cursor(conn, f"sketch_{table}", batch_size)
+    cursor.execute(
+        "SELECT " + ", ".join(quote_ident(col) for col in columns) + " "
+        + sampled_from_clause(table, dialect, schema, where=where),
+        params
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            for col, value in zip(columns, row):
+                sketches[col].add(value)
+    cursor.close()
+
+    return sketches
+
+
+def merge_table_sketches(*partials):
+    """Merge per-partition (or per-run) sketch dicts {column: ColumnSketch} into one"""
+    merged = {}
+    for sketches in partials:
+        for col, sketch in sketches.items():
+            if col in merged:
+                merged[col].merge(sketch)
+            else:
+                merged[col] = sketch
+    return merged
+
+
+def histogram_bounds(sketches):
+    return {
+        col: (sketch.histogram.low, sketch.histogram.high)
+        for col, sketch in sketches.items()
+        if sketch.histogram is not None
+    }
+
+
+def summarize_sketches(sketches):
+    return {col: sketch.summary() for col, sketch in sketches.items()}
+
+
+# -----------------------------
+# STORAGE (metadata/sketches/<table>.json)
+# -----------------------------
+
+def save_table_sketches(table, sketches, watermark=None):
+    os.makedirs(SKETCH_DIR, exist_ok=True)
+    payload = {
+        "table_name": table,
+        "watermark": watermark,
+        "columns": {col: sketch.to_dict() for col, sketch in sketches.items()}
+    }
+    with open(os.path.join(SKETCH_DIR, f"{table}.json"), "w") as f:
+        json.dump(payload, f)
+
+
+def load_table_sketches(table):
+    """Return (sketches, watermark) from disk, or (None, None) if there are none"""
+    path = os.path.join(SKETCH_DIR, f"{table}.json")
+    try:
+        with open(path, "r") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+
+    sketches = {col: ColumnSketch.from_dict(data) for col, data in payload["columns"].items()}
+    return sketches, payload.get("watermark")
+
+
+def refresh_table_sketches(conn, table, meta, quality, dialect="sqlite", schema="public"):
+    """
+    Bring the stored sketches of a table up to date with a fresh quality report.
+
+    When the report came from an incremental refresh and the stored sketches
+    end at the previous watermark, only rows in (old, new] watermark are
+    sketched and merged in; otherwise (or once too many values fall outside
+    the stored histogram bins) the table is sketched from scratch.
+    Returns the per-column summaries.
+    """
+    columns = [col["column_name"] for col in meta["columns"]]
+    watermark = quality.get("watermark")
+    mark = param_placeholder(dialect)
+
+    stored, stored_watermark = load_table_sketches(table)
+    incremental = (
+        stored is not None
+        and quality.get("refresh", {}).get("type") == "incremental"
+        and stored_watermark is not None
+        and stored_watermark.get("value") is not None
+        and watermark is not None
+        and stored_watermark.get("column") == watermark["column"]
+        and sorted(stored) == sorted(columns)
+    )
+
+    sketches = None
+    if incremental:
+        column = quote_ident(watermark["column"])
+        delta = build_table_sketches(conn, table, meta, dialect, schema,
+                                     f"{column} > {mark} AND {column} <= {mark}",
+                                     (stored_watermark["value"], watermark["value"]),
+                                     bounds=histogram_bounds(stored))
+        sketches = merge_table_sketches(stored, delta)
+        # Bins are fixed by the first build; once appended values drift past
+        # them, re-sketch from scratch so the bounds follow the data
+        if any(sketch.histogram is not None
+               and sketch.histogram.out_of_range_fraction() > HISTOGRAM_REBUILD_FRACTION
+               for sketch in sketches.values()):
+            sketches = None
+
+    if sketches is None:
+        where, params = None, ()
+        if watermark and watermark.get("value") is not None:
+            # Rows with a NULL watermark are old rows too (as in backend/incremental.py)
+            column = quote_ident(watermark["column"])
+            where = f"({column} <= {mark} OR {column} IS NULL)"
+            params = (watermark["value"],)
+        sketches = build_table_sketches(conn, table, meta, dialect, schema, where, params)
+
+    save_table_sketches(
+        table, sketches,
+        {"column": watermark["column"], "value": watermark["value"]} if watermark else None
+    )
+    return summarize_sketches(sketches)
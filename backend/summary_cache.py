@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import threading
+from backend.config import METADATA_DIR
+
+# -----------------------------
+# LLM SUMMARY CACHE
+# -----------------------------
+# Generated summaries stored on disk under a hash of everything that shapes
+# the completion (prompt inputs, model, prompt template version, temperature).
+# Same inputs -> same file, so unchanged tables never call the LLM again.
+# Least recently used files are evicted once the directory exceeds its size
+# budget (reads refresh a file's mtime).
+
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", os.path.join(METADATA_DIR, "cache", "summaries"))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+
+_lock = threading.Lock()
+
+
+def summary_key(inputs, model, prompt_version, temperature):
+    """Content address: sha256 of the canonical JSON of the prompt inputs and generation settings"""
+    payload = json.dumps(
+        {"inputs": inputs, "model": model, "prompt_version": prompt_version, "temperature": temperature},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path(key):
+    return os.path.join(SUMMARY_CACHE_DIR, f"{key}.md")
+
+
+def get_summary(key):
+    """Cached summary text, or None"""
+    path = _path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            summary = f.read()
+        os.utime(path)  # mark as recently used
+        return summary
+    except OSError:
+        return None
+
+
+def put_summary(key, summary):
+    os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+    path = _path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(summary)
+    os.replace(tmp_path, path)
+    _evict()
+
+
+def _evict():
+    """Drop least recently used summaries until the cache fits SUMMARY_CACHE_MAX_BYTES"""
+    with _lock:
+        entries = []
+        for entry in os.scandir(SUMMARY_CACHE_DIR):
+            if entry.name.endswith(".md"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= SUMMARY_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def cache_stats():
+    entries, total = 0, 0
+    if os.path.isdir(SUMMARY_CACHE_DIR):
+        for entry in os.scandir(SUMMARY_CACHE_DIR):
+            if entry.name.endswith(".md"):
+                entries += 1
+                total += entry.stat().st_size
+    return {"entries": entries, "bytes": total, "max_bytes": SUMMARY_CACHE_MAX_BYTES}
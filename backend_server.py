@@ -1,14 +1,37 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Match
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import json
+import datetime
+import threading
+import time
+from contextlib import closing, contextmanager
 from typing import List, Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
-from backend.metadata_extractor import extract_metadata
-from backend.quality_engine import analyze_quality
-from backend.ai_summarizer import generate_table_summary
+from backend.db_connector import (
+    QUERY_LOG, QUERY_LOG_ENABLED, ConnectionPool, add_query_listener, database_errors, get_dialect
+)
+from backend.metadata_extractor import (
+    extract_metadata, iter_table_batches, list_tables, read_catalog, stored_metadata, catalog_version,
+    changes_since
+)
+from backend.quality_engine import analyze_quality, check_duplicate_keys, load_quality_report, quality_snapshot
+from backend import metrics
+from backend.jobs import JobRunner
+from backend.pagination import check_page_size, decode_cursor, page
+from backend.ai_summarizer import (
+    AI_DOCS_DIR, get_client, llm_configured, stream_table_summary, summaries_in_flight, summarize_table
+)
+from backend.batch_summaries import generate_summaries
+from backend.profiler import count_rows, profile_table
+from backend.quality_history import row_count_series, completeness_series
+from backend.summary_cache import cache_stats as summary_cache_stats
+from backend.response_cache import (
+    MIN_COMPRESS_BYTES, ResponseCache, encode_body, etag_matches, negotiate_encoding
+)
 
 # Load environment variables
 load_dotenv()
@@ -24,19 +47,154 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database connection
-def get_db_connection():
+# -----------------------------
+# REQUEST METRICS
+# -----------------------------
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency histogram, request counter and in-flight gauge"""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def route_template(self, scope):
+        # Label by route template (/tables/{table_name}/...), never by raw path
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self.route_template(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc(route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec(route)
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], route)
+            metrics.HTTP_REQUESTS.inc(scope["method"], route, str(status))
+
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
+# Database connection pool (PostgreSQL when DB_HOST is set, SQLite otherwise).
+# Refresh jobs open their own connections but pass instrumented=True too, so
+# their queries show up in the same DB metrics.
+# DB endpoints are plain `def` so FastAPI runs them in its threadpool and
+# blocking driver calls never stall the event loop.
+db_pool = ConnectionPool(
+    max_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    check_after=float(os.getenv("DB_POOL_CHECK_AFTER", "30")),
+    instrumented=True
+)
+add_query_listener(metrics.observe_db_query)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection (503 if the pool is exhausted or the database is unreachable)"""
+    try:
+        conn = db_pool.acquire(timeout=DB_POOL_TIMEOUT)
+    except (TimeoutError, ConnectionError) as e:
+        raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
+
+    discard = False
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST", "localhost"),
-            database=os.getenv("DB_NAME", "datadoc_ai"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD", ""),
-            port=os.getenv("DB_PORT", "5432")
-        )
-        return conn
+        yield conn
+    except database_errors():
+        # Broken connections are replaced rather than returned to the pool
+        discard = True
+        raise
+    finally:
+        db_pool.release(conn, discard=discard)
+
+# Background refresh jobs (see backend/jobs.py)
+job_runner = JobRunner()
+
+# Cold starts: nothing slow happens at import. The first pooled connection
+# (and psycopg2) and the Groq client are opened by a background warm-up
+# after startup, so /health answers at once and /ready reports when the
+# dependencies are up.
+STARTED_AT = time.monotonic()
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "1") == "1"
+
+def warm_up():
+    try:
+        db_pool.release(db_pool.acquire(timeout=DB_POOL_TIMEOUT))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+        print(f"⚠️ Database warm-up failed: {e}")
+    try:
+        get_client()
+    except Exception as e:
+        print(f"⚠️ LLM client warm-up failed: {e}")
+
+@app.on_event("startup")
+def startup():
+    if WARM_UP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown():
+    job_runner.shutdown()
+    db_pool.close_all()
+
+# Response cache for catalog endpoints. Scopes: "metadata" (table lists and
+# schemas, bumped by /refresh-metadata), "quality" (bumped by both refreshes)
+# and "docs" (bumped when an AI summary is generated).
+response_cache = ResponseCache()
+
+def cached_json(request: Request, scopes, build, compress: bool = False):
+    """Serve build()'s JSON from the cache, with an ETag and 304 on If-None-Match
+
+    compress=True also gzip/brotli-encodes the body per Accept-Encoding
+    (encoded variants are cached too and get their own ETag).
+    """
+    key = response_cache.key(scopes, request.url.path, tuple(sorted(request.query_params.multi_items())))
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if compress else None
+
+    cached = response_cache.get(key + (encoding,))
+    if cached is None:
+        identity = response_cache.get(key + (None,)) if encoding else None
+        if identity is None:
+            metrics.RESPONSE_CACHE_LOOKUPS.inc("miss")
+            body = json.dumps(jsonable_encoder(build())).encode("utf-8")
+            etag = response_cache.put(key + (None,), body)
+        else:
+            metrics.RESPONSE_CACHE_LOOKUPS.inc("hit")
+            body, etag = identity
+
+        if encoding and len(body) >= MIN_COMPRESS_BYTES:
+            body = encode_body(body, encoding)
+            etag = response_cache.put(key + (encoding,), body, etag=etag[:-1] + f'-{encoding}"')
+        else:
+            encoding = None
+    else:
+        metrics.RESPONSE_CACHE_LOOKUPS.inc("hit")
+        body, etag = cached
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if compress:
+        headers["Vary"] = "Accept-Encoding"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/")
 async def root():
@@ -44,164 +202,597 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """Liveness: the process is serving (no database or LLM calls, so it answers during cold starts)"""
+    return {"status": "healthy", "uptime_seconds": round(time.monotonic() - STARTED_AT, 3), "pool": db_pool.stats()}
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    """Readiness: 200 once the database answers, 503 (with the error) until then"""
+    error = None
     try:
-        conn = get_db_connection()
-        conn.close()
-        return {"status": "healthy", "database": "connected"}
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except HTTPException as e:
+        error = e.detail
     except Exception as e:
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+        error = str(e)
+
+    if error:
+        response.status_code = 503
+    return {
+        "status": "not_ready" if error else "ready",
+        "database": "disconnected" if error else "connected",
+        "error": error,
+        "ai_summaries": llm_configured(),
+        "pool": db_pool.stats()
+    }
 
 @app.get("/tables")
-async def get_tables():
-    """Get list of all tables in the database"""
+def get_tables(request: Request, limit: int = None, cursor: str = None, schema: str = "public"):
+    """Get list of all tables in the database
+
+    With limit= the list is keyset-paginated: pass the returned next_cursor
+    as cursor= to fetch the following page.
+    """
+    return cached_json(request, "metadata", lambda: fetch_tables(limit, cursor, schema))
+
+def fetch_tables(limit=None, cursor=None, schema="public"):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            ORDER BY table_name;
-        """)
-        
-        tables = [row["table_name"] for row in cursor.fetchall()]
-        conn.close()
-        
-        return {"tables": tables}
+        check_page_size(limit)
+        after = decode_cursor(cursor)["after"] if cursor else None
+
+        with db_connection() as conn, closing(conn.cursor()) as db_cursor:
+            tables = list_tables(db_cursor, get_dialect(conn), schema, after, limit + 1 if limit else None)
+
+        if limit is None and cursor is None:
+            return {"tables": tables}
+        tables, next_cursor = page(tables, limit)
+        return {"tables": tables, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch tables: {str(e)}")
 
 @app.get("/tables/{table_name}/metadata")
-async def get_table_metadata(table_name: str):
-    """Get metadata for a specific table"""
+def get_table_metadata(request: Request, table_name: str, count: str = "estimated"):
+    """Get metadata for a specific table (count=estimated reads catalog stats, count=exact runs COUNT(*))"""
+    if count == "exact":
+        # An exact count must reflect the table now, not a response up to the cache TTL old
+        return fetch_table_metadata(table_name, count)
+    return cached_json(request, "metadata", lambda: fetch_table_metadata(table_name, count))
+
+def fetch_table_metadata(table_name, count="estimated"):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get column information
-        cursor.execute("""
-            SELECT 
-                column_name,
-                data_type,
-                is_nullable,
-                column_default,
-                character_maximum_length
-            FROM information_schema.columns 
-            WHERE table_name = %s AND table_schema = 'public'
-            ORDER BY ordinal_position;
-        """, (table_name,))
+        with db_connection() as conn, closing(conn.cursor()) as cursor:
+            dialect = get_dialect(conn)
+            
+            # Columns, keys and indexes in a few set-based catalog queries
+            catalog = read_catalog(cursor, dialect, tables=[table_name])
+            if table_name not in catalog:
+                raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+            table_metadata = catalog[table_name]
+            
+            # Get row count (catalog estimate unless count=exact)
+            row_count, row_count_type = count_rows(cursor, table_name, dialect, count=count)
         
         columns = []
-        for row in cursor.fetchall():
+        for col in table_metadata["columns"]:
             columns.append({
-                "column_name": row["column_name"],
-                "data_type": row["data_type"],
-                "is_nullable": row["is_nullable"],
-                "default_value": row["column_default"],
-                "max_length": row["character_maximum_length"]
+                "column_name": col["column_name"],
+                "data_type": col["data_type"],
+                "is_nullable": "NO" if col["not_null"] else "YES",
+                "default_value": col["default_value"],
+                "max_length": col.get("max_length")
             })
         
-        # Get primary keys
-        cursor.execute("""
-            SELECT kcu.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-                ON tc.constraint_name = kcu.constraint_name
-                AND tc.table_schema = kcu.table_schema
-            WHERE tc.constraint_type = 'PRIMARY KEY'
-                AND tc.table_name = %s
-                AND tc.table_schema = 'public';
-        """, (table_name,))
-        
-        primary_keys = [row["column_name"] for row in cursor.fetchall()]
-        
-        # Get row count
-        cursor.execute(f"SELECT COUNT(*) as count FROM {table_name};")
-        row_count = cursor.fetchone()["count"]
-        
-        conn.close()
-        
         return {
             "table_name": table_name,
             "columns": columns,
-            "primary_keys": primary_keys,
-            "row_count": row_count
+            "primary_keys": table_metadata["primary_keys"],
+            "foreign_keys": table_metadata["foreign_keys"],
+            "indexes": table_metadata["indexes"],
+            "row_count": row_count,
+            "row_count_type": row_count_type
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch metadata: {str(e)}")
 
 @app.post("/tables/{table_name}/summary")
-async def generate_summary(table_name: str):
-    """Generate AI summary for a table"""
+def generate_summary(table_name: str, refresh: bool = False, timeout: float = None):
+    """Generate AI summary for a table (reused while its metadata and quality are unchanged; refresh=true regenerates)
+
+    Identical requests already in progress are joined rather than repeated;
+    timeout (seconds) bounds how long to wait for one (504 after that).
+    """
+    try:
+        result = summarize_table(table_name, use_cache=not refresh, wait_timeout=timeout)
+        response_cache.bump("docs")
+        return result
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate summary: {str(e)}")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/tables/{table_name}/summary/stream")
+def stream_summary(table_name: str, refresh: bool = False, timeout: float = None):
+    """
+    Server-sent events for an AI summary as the LLM writes it: "meta", then
+    "delta" events ({"text"}), then "done" once it is saved to ai_docs/ (or "error").
+    """
+    events = stream_table_summary(table_name, use_cache=not refresh, wait_timeout=timeout)
     try:
-        summary = generate_table_summary(table_name)
-        return {"summary": summary}
+        # The first event comes after the inputs are loaded, so setup errors still get a status code
+        first = next(events)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No metadata/quality data for table: {table_name}")
+    except TimeoutError as e:
+        # Waiting on an identical generation happens before the first event
+        raise HTTPException(status_code=504, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate summary: {str(e)}")
 
+    def body():
+        yield sse_event(*first)
+        try:
+            for event, data in events:
+                if event == "delta":
+                    data = {"text": data}
+                elif event == "done":
+                    response_cache.bump("docs")
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Failed to generate summary: {str(e)}"})
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/tables/{table_name}/quality")
-async def get_table_quality(table_name: str):
-    """Get data quality metrics for a table"""
+def get_table_quality(request: Request, table_name: str, mode: str = "exact", sample_fraction: float = None,
+                      sample_rows: int = None, sample_method: str = "SYSTEM", max_age: float = None):
+    """Get data quality metrics for a table
+
+    Serves the latest stored profiling snapshot when there is one for this
+    mode; max_age (seconds) rejects older snapshots and max_age=0 always
+    profiles live. Live profiling is one aggregate scan (mode=approximate
+    scans a TABLESAMPLE and adds confidence intervals).
+    """
+    if max_age is not None:
+        # Snapshot age moves with the clock, so these bypass the response cache
+        return fetch_table_quality(table_name, mode, sample_fraction, sample_rows, sample_method, max_age)
+    return cached_json(request, "quality", lambda: fetch_table_quality(
+        table_name, mode, sample_fraction, sample_rows, sample_method
+    ))
+
+def snapshot_age(report):
+    """Seconds since a stored report was profiled (None if it carries no timestamp)"""
+    profiled_at = report.get("profiled_at") or report.get("watermark", {}).get("recorded_at")
+    if not profiled_at:
+        return None
+    profiled = datetime.datetime.fromisoformat(profiled_at)
+    return (datetime.datetime.now(datetime.timezone.utc) - profiled).total_seconds()
+
+def quality_response(table_name, quality, source):
+    # The frontend derives "missing" from total_count: rows scanned (the sample size when sampled)
+    scanned = quality["sample"]["sample_rows"] if "sample" in quality else quality["total_rows"]
+    column_completeness = {
+        col_name: dict(metrics, total_count=scanned)
+        for col_name, metrics in quality["column_completeness"].items()
+    }
+
+    response = {
+        "table_name": table_name,
+        "mode": quality["mode"],
+        "source": source,
+        "profiled_at": quality.get("profiled_at"),
+        "total_rows": quality["total_rows"],
+        "row_count_type": quality.get("row_count_type"),
+        "column_completeness": column_completeness,
+        "duplicate_primary_keys": quality.get("duplicate_primary_keys"),
+        "duplicate_rows": quality.get("duplicate_rows"),
+        "freshness_column": quality.get("freshness_column"),
+        "last_updated": quality.get("last_updated")
+    }
+    if "sample" in quality:
+        response["sample"] = quality["sample"]
+    return response
+
+def fetch_table_quality(table_name, mode="exact", sample_fraction=None, sample_rows=None,
+                        sample_method="SYSTEM", max_age=None):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get total row count
-        cursor.execute(f"SELECT COUNT(*) as total_rows FROM {table_name};")
-        total_rows = cursor.fetchone()["total_rows"]
-        
-        # Get column completeness
-        cursor.execute(f"""
-            SELECT 
-                column_name,
-                COUNT(*) as total_count,
-                COUNT(CASE WHEN {table_name}.column_name IS NOT NULL THEN 1 END) as non_null_count
-            FROM {table_name}
-            CROSS JOIN information_schema.columns
-            WHERE information_schema.columns.table_name = %s 
-                AND information_schema.columns.table_schema = 'public'
-                AND information_schema.columns.column_name = column_name
-            GROUP BY column_name;
-        """, (table_name,))
-        
-        column_completeness = {}
-        for row in cursor.fetchall():
-            completeness = (row["non_null_count"] / row["total_count"]) * 100 if row["total_count"] > 0 else 0
-            column_completeness[row["column_name"]] = {
-                "total_count": row["total_count"],
-                "non_null_count": row["non_null_count"],
-                "completeness_percent": round(completeness, 2)
-            }
-        
-        conn.close()
-        
-        return {
-            "table_name": table_name,
-            "total_rows": total_rows,
-            "column_completeness": column_completeness
-        }
+        # Stored snapshot from the last refresh, if it matches the request and is fresh enough
+        if sample_fraction is None and sample_rows is None and max_age != 0:
+            stored = load_quality_report(table_name)
+            if stored is not None and stored.get("mode", "exact") == mode:
+                age = snapshot_age(stored)
+                if max_age is None or (age is not None and age <= max_age):
+                    return quality_response(table_name, stored, "snapshot")
+
+        with db_connection() as conn, closing(conn.cursor()) as cursor:
+            dialect = get_dialect(conn)
+
+            catalog = read_catalog(cursor, dialect, tables=[table_name])
+            if table_name not in catalog:
+                raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+
+            # Row count, per-column COUNT(col), PK duplicates and freshness in one scan
+            quality = profile_table(
+                cursor, table_name, catalog[table_name], dialect, mode=mode,
+                sample_fraction=sample_fraction, sample_rows=sample_rows,
+                sample_method=sample_method
+            )
+            check_duplicate_keys(conn, table_name, catalog[table_name], quality, dialect)
+
+        quality["profiled_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        return quality_response(table_name, quality, "live")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to analyze quality: {str(e)}")
 
-@app.post("/refresh-metadata")
-async def refresh_metadata():
-    """Refresh metadata for all tables"""
+CATALOG_FIELDS = ("metadata", "quality", "docs")
+
+def parse_catalog_fields(fields):
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(CATALOG_FIELDS)
+    unknown = sorted(set(field_list) - set(CATALOG_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown catalog fields: {unknown} (use {list(CATALOG_FIELDS)})")
+    return field_list
+
+def parse_names(names):
+    return {n.strip() for n in names.split(",") if n.strip()} if names else None
+
+def doc_status(table, updated_at=None):
+    if updated_at is None:
+        try:
+            updated_at = os.stat(os.path.join(AI_DOCS_DIR, f"{table}.md")).st_mtime
+        except OSError:
+            return {"generated": False, "updated_at": None}
+    return {
+        "generated": True,
+        "updated_at": datetime.datetime.fromtimestamp(updated_at, datetime.timezone.utc).isoformat(timespec="seconds")
+    }
+
+@app.get("/catalog")
+def get_catalog(request: Request, names: str = None, fields: str = None, limit: int = None, cursor: str = None):
+    """Stored metadata, quality and AI-doc status for many tables in one response
+
+    names= and fields= are comma-separated filters (fields: metadata, quality,
+    docs; default all); limit= / cursor= paginate like /tables, reading the
+    metadata of just that page from the database. The body is
+    gzip/brotli-compressed when accepted.
+    """
+    return cached_json(request, ("metadata", "quality", "docs"),
+                       lambda: fetch_catalog(names, fields, limit, cursor), compress=True)
+
+def fetch_catalog(names=None, fields=None, limit=None, cursor=None, schema="public"):
+    try:
+        field_list = parse_catalog_fields(fields)
+        check_page_size(limit)
+        wanted = parse_names(names)
+
+        if limit is None and cursor is None:
+            metadata = stored_metadata()
+            tables = sorted(metadata) if wanted is None else sorted(t for t in metadata if t in wanted)
+        else:
+            # Keyset page from the database listing; only the page's metadata is read
+            after = decode_cursor(cursor)["after"] if cursor else None
+            with db_connection() as conn, closing(conn.cursor()) as db_cursor:
+                dialect = get_dialect(conn)
+                if wanted is None:
+                    tables = list_tables(db_cursor, dialect, schema, after, limit + 1 if limit else None)
+                    metadata = read_catalog(db_cursor, dialect, schema, tables) if "metadata" in field_list else {}
+                else:
+                    # names= is short; reading it also drops tables that don't exist
+                    metadata = read_catalog(db_cursor, dialect, schema,
+                                            [t for t in wanted if after is None or t > after])
+                    tables = sorted(metadata)
+            tables, next_cursor = page(tables, limit)
+
+        # One directory listing instead of a stat per table
+        docs = {}
+        if "docs" in field_list and os.path.isdir(AI_DOCS_DIR):
+            for entry in os.scandir(AI_DOCS_DIR):
+                if entry.name.endswith(".md"):
+                    docs[entry.name[:-3]] = entry.stat().st_mtime
+
+        catalog = {}
+        for table in tables:
+            entry = {}
+            if "metadata" in field_list:
+                entry["metadata"] = metadata[table]
+            if "quality" in field_list:
+                entry["quality"] = load_quality_report(table)
+            if "docs" in field_list:
+                entry["docs"] = doc_status(table, docs.get(table)) if table in docs else {
+                    "generated": False, "updated_at": None
+                }
+            catalog[table] = entry
+
+        response = {"version": catalog_version(), "count": len(catalog), "tables": catalog}
+        if limit is not None or cursor is not None:
+            response["next_cursor"] = next_cursor
+        return response
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build catalog: {str(e)}")
+
+# -----------------------------
+# NDJSON STREAMS
+# -----------------------------
+# One JSON object per line, produced batch by batch from a server-side
+# cursor over the table list, so memory stays flat for any catalog size.
+
+STREAM_BATCH_SIZE = 500
+
+def stream_lines(build_batch, schema, names):
+    """NDJSON lines for each batch of table names; errors after the headers become an {"error"} line"""
+    wanted = parse_names(names)
+    try:
+        with db_connection() as conn:
+            dialect = get_dialect(conn)
+            for tables in iter_table_batches(conn, dialect, schema, STREAM_BATCH_SIZE):
+                if wanted is not None:
+                    tables = [table for table in tables if table in wanted]
+                if not tables:
+                    continue
+                for line in build_batch(conn, dialect, tables):
+                    yield json.dumps(jsonable_encoder(line)) + "\n"
+    except HTTPException as e:
+        yield json.dumps({"error": e.detail}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+@app.get("/catalog/stream")
+def stream_catalog(fields: str = None, names: str = None, schema: str = "public"):
+    """NDJSON export of live metadata, stored quality and doc status ({"table", ...} per line)"""
+    field_list = parse_catalog_fields(fields)
+
+    def build_batch(conn, dialect, tables):
+        metadata = {}
+        if "metadata" in field_list:
+            with closing(conn.cursor()) as cursor:
+                metadata = read_catalog(cursor, dialect, schema, tables)
+        for table in tables:
+            line = {"table": table}
+            if "metadata" in field_list:
+                line["metadata"] = metadata.get(table)
+            if "quality" in field_list:
+                line["quality"] = load_quality_report(table)
+            if "docs" in field_list:
+                line["docs"] = doc_status(table)
+            yield line
+
+    return StreamingResponse(stream_lines(build_batch, schema, names), media_type="application/x-ndjson")
+
+@app.get("/quality/stream")
+def stream_quality(names: str = None, schema: str = "public"):
+    """NDJSON export of the stored quality report of every table ({"table", "quality"} per line)"""
+    def build_batch(conn, dialect, tables):
+        for table in tables:
+            yield {"table": table, "quality": load_quality_report(table)}
+
+    return StreamingResponse(stream_lines(build_batch, schema, names), media_type="application/x-ndjson")
+
+@app.get("/tables/{table_name}/history/row-count")
+def get_row_count_history(table_name: str, since: str = None, until: str = None,
+                          bucket: str = None, limit: int = None):
+    """Row-count time series from the quality history store"""
+    try:
+        series = row_count_series(table_name, since, until, bucket, limit)
+        return {"table_name": table_name, "bucket": bucket, "series": series}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read quality history: {str(e)}")
+
+@app.get("/tables/{table_name}/history/completeness")
+def get_completeness_history(table_name: str, columns: str = None, since: str = None,
+                             until: str = None, bucket: str = None, limit: int = None):
+    """Per-column completeness time series (columns= is a comma-separated filter)"""
+    try:
+        column_list = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+        series = completeness_series(table_name, column_list, since, until, bucket, limit)
+        return {"table_name": table_name, "bucket": bucket, "series": series}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read quality history: {str(e)}")
+
+@app.get("/catalog/changes")
+def get_catalog_changes(since: int = 0):
+    """Tables added/modified/removed after schema version `since`"""
+    try:
+        return changes_since(since)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read catalog changes: {str(e)}")
+
+@app.post("/refresh-metadata", status_code=202)
+def refresh_metadata(force: bool = False):
+    """Start a metadata refresh job (only tables whose schema changed are rewritten)"""
+    def run(job):
+        job.report(message="Reading catalog")
+        result = extract_metadata(force=force, instrumented=True)
+        return {"tables": list(result.keys()), "version": catalog_version()}
+
     try:
-        result = extract_metadata()
-        return {"message": "Metadata refreshed successfully", "tables": list(result.keys())}
+        job, created = job_runner.submit("refresh-metadata", run, on_finish=bump_after("metadata", "quality"),
+                                         force=force)
+        return {
+            "message": "Metadata refresh started" if created else "Metadata refresh already running",
+            "job": job.to_dict(include_result=False)
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to refresh metadata: {str(e)}")
 
-@app.post("/refresh-quality")
-async def refresh_quality():
-    """Refresh quality metrics for all tables"""
+@app.post("/refresh-quality", status_code=202)
+def refresh_quality(incremental: bool = False, background: bool = False):
+    """Start a quality refresh job for all tables (incremental=true only profiles new rows)
+
+    background=true also answers at once with catalog-estimated row counts
+    from the last stored reports.
+    """
+    def run(job):
+        def on_progress(event):
+            job.report(event["completed"], event["total"], f"{event['table']}: {event['status']}")
+
+        results, errors = analyze_quality(incremental=incremental, on_progress=on_progress,
+                                          cancel_event=job.cancel_event, instrumented=True)
+        return {"tables": list(results.keys()), "errors": errors}
+
     try:
-        result = analyze_quality()
-        return {"message": "Quality metrics refreshed successfully", "tables": list(result.keys())}
+        job, created = job_runner.submit("refresh-quality", run, on_finish=bump_after("quality"),
+                                         incremental=incremental)
+        response = {
+            "message": "Quality refresh started" if created else "Quality refresh already running",
+            "job": job.to_dict(include_result=False)
+        }
+        if background:
+            snapshot = quality_snapshot()
+            response["row_counts"] = {
+                table: {"row_count": report["total_rows"], "row_count_type": report["row_count_type"]}
+                for table, report in snapshot.items()
+            }
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to refresh quality: {str(e)}")
 
+@app.post("/refresh-summaries", status_code=202)
+def refresh_summaries(force: bool = False):
+    """Start a job that writes AI summaries for every table (unchanged tables are skipped; force=true regenerates all)"""
+    if not llm_configured():
+        raise HTTPException(status_code=503, detail="AI summaries are disabled. Set GROQ_API_KEY to enable them.")
+
+    def run(job):
+        def on_progress(event):
+            job.report(event["completed"], event["total"], f"{event['table']}: {event['status']}")
+
+        results, errors = generate_summaries(use_cache=not force, on_progress=on_progress,
+                                             cancel_event=job.cancel_event)
+        return {"tables": results, "errors": errors}
+
+    try:
+        job, created = job_runner.submit("refresh-summaries", run, on_finish=bump_after("docs"), force=force)
+        return {
+            "message": "Summary generation started" if created else "Summary generation already running",
+            "job": job.to_dict(include_result=False)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start summary generation: {str(e)}")
+
+def bump_after(*scopes):
+    """on_finish hook: invalidate cached responses once a refresh job has written new data"""
+    def on_finish(job):
+        if job.status in ("succeeded", "cancelled"):
+            response_cache.bump(*scopes)
+    return on_finish
+
+POOL_CONNECTIONS = metrics.Gauge("datadoc_db_pool_connections", "Pooled database connections", ("state",))
+POOL_MAX_SIZE = metrics.Gauge("datadoc_db_pool_max_size", "Configured database pool size")
+POOL_RECYCLED = metrics.Gauge("datadoc_db_pool_recycled", "Pooled connections replaced after a failed check or max lifetime")
+CACHE_HIT_RATIO = metrics.Gauge("datadoc_response_cache_hit_ratio", "Response cache hits / lookups")
+CACHE_SIZE = metrics.Gauge("datadoc_response_cache_size", "Response cache contents", ("unit",))
+SUMMARIES_IN_FLIGHT = metrics.Gauge("datadoc_summaries_in_flight", "Distinct summary generations running")
+SUMMARY_CACHE_SIZE = metrics.Gauge("datadoc_summary_cache_size", "Cached LLM summaries on disk", ("unit",))
+JOBS = metrics.Gauge("datadoc_jobs", "Background jobs currently remembered", ("status",))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics: request latency, DB queries, LLM calls, cache and pool state"""
+    # Point-in-time gauges are read at scrape time rather than on the hot path
+    pool = db_pool.stats()
+    POOL_CONNECTIONS.set(pool["in_use"], "in_use")
+    POOL_CONNECTIONS.set(pool["idle"], "idle")
+    POOL_MAX_SIZE.set(pool["max_size"])
+    POOL_RECYCLED.set(pool["recycled"])
+
+    cache = response_cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    CACHE_HIT_RATIO.set(round(cache["hits"] / lookups, 4) if lookups else 0)
+    CACHE_SIZE.set(cache["entries"], "entries")
+    CACHE_SIZE.set(cache["bytes"], "bytes")
+
+    SUMMARIES_IN_FLIGHT.set(summaries_in_flight())
+    summaries = summary_cache_stats()
+    SUMMARY_CACHE_SIZE.set(summaries["entries"], "entries")
+    SUMMARY_CACHE_SIZE.set(summaries["bytes"], "bytes")
+
+    statuses = {status: 0 for status in ("queued", "running", "succeeded", "failed", "cancelled")}
+    for job in job_runner.list():
+        statuses[job.status] = statuses.get(job.status, 0) + 1
+    for status, count in statuses.items():
+        JOBS.set(count, status)
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs")
+def list_jobs(kind: str = None):
+    """Queued, running and recently finished background jobs (newest first, without results)"""
+    return {"jobs": [job.to_dict(include_result=False) for job in reversed(job_runner.list(kind))]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, progress and (once finished) result of a background job"""
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Cancel a queued or running job (a running quality refresh stops after the tables in flight)"""
+    job = job_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict(include_result=False)
+
+# -----------------------------
+# QUERY DIAGNOSTICS (DB_QUERY_LOG=1)
+# -----------------------------
+
+def require_query_log():
+    if not QUERY_LOG_ENABLED:
+        raise HTTPException(status_code=404, detail="Query log is disabled (set DB_QUERY_LOG=1)")
+
+@app.get("/diagnostics/queries")
+def get_query_stats(sort: str = "total_seconds", limit: int = 50):
+    """Per-fingerprint statement stats (SQL with literals redacted), slowest first"""
+    require_query_log()
+    try:
+        queries = QUERY_LOG.stats(sort=sort, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"slow_query_seconds": QUERY_LOG.slow_seconds, "queries": queries}
+
+@app.get("/diagnostics/slow-queries")
+def get_slow_queries(limit: int = 50):
+    """Most recent statements over DB_SLOW_QUERY_SECONDS (newest first, EXPLAIN plan on PostgreSQL if enabled)"""
+    require_query_log()
+    return {"slow_query_seconds": QUERY_LOG.slow_seconds, "queries": QUERY_LOG.slow_queries(limit)}
+
+@app.post("/diagnostics/queries/reset")
+def reset_query_stats():
+    require_query_log()
+    QUERY_LOG.reset()
+    return {"message": "Query stats cleared"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
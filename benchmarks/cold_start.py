@@ -0,0 +1,155 @@
+"""
+Cold-start report for the backend: import-time profile and time to first /health.
+
+Runs `python -X importtime -c "import backend_server"` in a fresh interpreter
+and lists the slowest imports (cumulative), flags heavy optional modules
+(groq, psycopg2) that were imported eagerly, then times fresh processes from
+interpreter start to the first /health response through a TestClient.
+
+Usage:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --repeat 10 --budget-ms 300 --fail-over-budget
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "cold_start.json")
+
+# Should only be imported when first needed (LLM summary / PostgreSQL connection)
+LAZY_MODULES = ("groq", "psycopg2")
+
+FIRST_HEALTH_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import backend_server
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(backend_server.app) as client:
+    response = client.get("/health")
+answered = time.perf_counter()
+print(json.dumps({
+    "status_code": response.status_code,
+    "import_s": imported - start,
+    "first_health_s": answered - start,
+    "eager_modules": [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+
+# -----------------------------
+# IMPORT PROFILE
+# -----------------------------
+
+def import_profile(env, top):
+    """Slowest imports of backend_server from -X importtime (microseconds -> ms)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend_server"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": round(int(self_us) / 1000, 2),
+            "cumulative_ms": round(int(cumulative_us) / 1000, 2)
+        })
+
+    total = next((m["cumulative_ms"] for m in modules if m["module"] == "backend_server"), None)
+    modules.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return {
+        "total_ms": total,
+        "eager_modules": sorted({m["module"] for m in modules if m["module"].split(".")[0] in LAZY_MODULES}),
+        "slowest": modules[:top]
+    }
+
+
+# -----------------------------
+# TIME TO FIRST /health
+# -----------------------------
+
+def first_health(env, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", FIRST_HEALTH_SCRIPT], cwd=ROOT_DIR, env=env, capture_output=True, text=True
+        )
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        if run["status_code"] != 200:
+            raise RuntimeError(f"/health returned {run['status_code']}")
+        # Wall time includes interpreter start-up and process exit
+        run["process_wall_s"] = wall
+        runs.append(run)
+
+    def median_ms(key):
+        return round(statistics.median(run[key] for run in runs) * 1000, 1)
+
+    return {
+        "runs": repeat,
+        "import_ms": median_ms("import_s"),
+        "first_health_ms": median_ms("first_health_s"),
+        "process_wall_ms": median_ms("process_wall_s"),
+        "eager_modules": sorted({name for run in runs for name in run["eager_modules"]})
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataDoc AI backend cold-start report")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes to time")
+    parser.add_argument("--top", type=int, default=25, help="slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=300, help="target for the first /health response")
+    parser.add_argument("--fail-over-budget", action="store_true")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    report = {"budget_ms": args.budget_ms, "imports": import_profile(env, args.top)}
+
+    print(f"📦 import backend_server: {report['imports']['total_ms']} ms")
+    for module in report["imports"]["slowest"]:
+        print(f"   {module['cumulative_ms']:>9.2f} ms  {'  ' * module['depth']}{module['module']}")
+    if report["imports"]["eager_modules"]:
+        print(f"⚠️ Imported eagerly: {report['imports']['eager_modules']}")
+
+    try:
+        report["first_health"] = first_health(env, args.repeat)
+    except Exception as e:
+        report["first_health"] = {"error": str(e)}
+        print(f"❌ First /health: {e}")
+
+    over_budget = False
+    if "first_health_ms" in report["first_health"]:
+        first = report["first_health"]
+        over_budget = first["first_health_ms"] > args.budget_ms
+        flag = "🔴" if over_budget else "🟢"
+        print(f"{flag} First /health: {first['first_health_ms']} ms (import {first['import_ms']} ms, "
+              f"process {first['process_wall_ms']} ms) - budget {args.budget_ms:g} ms")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"✅ Results written to {args.output}")
+
+    if over_budget and args.fail_over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
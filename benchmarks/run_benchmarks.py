@@ -0,0 +1,309 @@
+"""
+Performance benchmarks for metadata extraction, quality profiling and the API.
+
+Builds a throwaway SQLite database from the customers / orders / payments
+schema in backend/create_fake_data.py (widened with extra columns), then
+times extract_metadata(), analyze_quality() and the FastAPI endpoints in
+backend_server.py through a TestClient. Results go to a JSON file and are
+compared against a stored baseline so regressions can be caught offline.
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 100000 --columns 50
+    python benchmarks/run_benchmarks.py --rows 1000000 --save-baseline
+    python benchmarks/run_benchmarks.py --rows 1000000 --fail-on-regression
+
+With --postgres the suite runs against the database in the DB_* variables
+(loaded with the same data) instead of a generated SQLite file.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Same tables as backend/create_fake_data.py; extra_NNN columns pad each
+# table up to the requested width.
+BASE_SCHEMA = {
+    "customers": [
+        ("customer_id", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+        ("name", "TEXT"),
+        ("email", "TEXT"),
+        ("city", "TEXT"),
+        ("created_at", "TEXT"),
+    ],
+    "orders": [
+        ("order_id", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+        ("customer_id", "INTEGER"),
+        ("order_date", "TEXT"),
+        ("total_amount", "REAL"),
+        ("shipping_address", "TEXT"),
+    ],
+    "payments": [
+        ("payment_id", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+        ("order_id", "INTEGER"),
+        ("payment_method", "TEXT"),
+        ("payment_status", "TEXT"),
+        ("paid_at", "TEXT"),
+    ],
+}
+
+# SQL expressions over the generator's row number `n` (roughly the
+# null/skew patterns of the demo data)
+BASE_VALUES = {
+    "customers": [
+        "'Customer ' || n",
+        "CASE WHEN n % 5 = 0 THEN NULL ELSE 'user' || n || '@example.com' END",
+        "CASE n % 6 WHEN 0 THEN 'Chennai' WHEN 1 THEN 'Mumbai' WHEN 2 THEN 'Bangalore' "
+        "WHEN 3 THEN 'Hyderabad' WHEN 4 THEN 'Delhi' ELSE 'Kochi' END",
+        "date('2024-01-01', '+' || (n % 365) || ' days')",
+    ],
+    "orders": [
+        "1 + (n * 7919) % {customers}",
+        "date('2024-02-01', '+' || (n % 365) || ' days')",
+        "round(100 + (n * 37) % 15000, 2)",
+        "CASE WHEN n % 7 = 0 THEN NULL ELSE 'City ' || (n % 40) END",
+    ],
+    "payments": [
+        "1 + (n * 104729) % {orders}",
+        "CASE n % 3 WHEN 0 THEN 'UPI' WHEN 1 THEN 'CARD' ELSE 'NETBANKING' END",
+        "CASE WHEN n % 11 = 0 THEN 'FAILED' WHEN n % 13 = 0 THEN 'PENDING' ELSE 'SUCCESS' END",
+        "datetime('2024-02-01 10:00:00', '+' || (n % 500000) || ' minutes')",
+    ],
+}
+
+
+# -----------------------------
+# DATASET
+# -----------------------------
+
+def build_database(path, rows, columns):
+    """Create the benchmark database: every table gets `rows` rows and `columns` columns"""
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    for table, base_columns in BASE_SCHEMA.items():
+        extra = [f"extra_{i:03d}" for i in range(max(0, columns - len(base_columns)))]
+        ddl = [f"{name} {decl}" for name, decl in base_columns] + [f"{name} TEXT" for name in extra]
+        conn.execute(f"CREATE TABLE {table} ({', '.join(ddl)})")
+
+        # Extra columns: ~10% NULLs, low-cardinality text
+        value_sql = [v.format(customers=rows, orders=rows) for v in BASE_VALUES[table]]
+        value_sql += [
+            f"CASE WHEN (n + {i}) % 10 = 0 THEN NULL ELSE 'v' || ((n * {i + 3}) % 1000) END"
+            for i in range(len(extra))
+        ]
+        insert_columns = [name for name, _ in base_columns[1:]] + extra
+
+        conn.execute(f"""
+            INSERT INTO {table} ({', '.join(insert_columns)})
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(rows)})
+            SELECT {', '.join(value_sql)} FROM seq
+        """)
+        conn.commit()
+
+    conn.close()
+
+
+# -----------------------------
+# TIMING
+# -----------------------------
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_s": round(statistics.median(timings), 6),
+        "min_s": round(min(timings), 6),
+        "runs": repeat
+    }
+
+
+def run_suite(args, work_dir):
+    # Point every backend module at the benchmark database / metadata dir
+    # before they are imported (they read these at import time).
+    db_path = os.path.join(work_dir, "bench.db")
+    metadata_dir = os.path.join(work_dir, "metadata")
+    os.makedirs(metadata_dir, exist_ok=True)
+
+    os.environ["SQLITE_DB_PATH"] = db_path
+    os.environ["DATADOC_METADATA_DIR"] = metadata_dir
+    os.environ["QUALITY_HISTORY_DB"] = os.path.join(metadata_dir, "quality_history.db")
+    if not args.postgres:
+        # Empty (not unset) so python-dotenv can't re-populate it from .env
+        os.environ["DB_HOST"] = ""
+
+        start = time.perf_counter()
+        build_database(db_path, args.rows, args.columns)
+        print(f"📦 Built {args.rows:,} rows x {args.columns} columns per table in {time.perf_counter() - start:.1f}s")
+
+    sys.path.insert(0, ROOT_DIR)
+    from backend.metadata_extractor import extract_metadata
+    from backend.quality_engine import analyze_quality
+
+    results = {}
+
+    def bench(name, fn, repeat=args.repeat):
+        try:
+            results[name] = time_call(fn, repeat)
+            print(f"⏱️  {name}: {results[name]['median_s'] * 1000:.1f} ms (median of {repeat})")
+        except Exception as e:
+            results[name] = {"error": str(e)}
+            print(f"❌ {name}: {e}")
+
+    bench("extract_metadata.full", lambda: extract_metadata(force=True))
+    bench("extract_metadata.cached", extract_metadata)
+    bench("analyze_quality.exact", lambda: analyze_quality(workers=args.workers, record_history=False))
+    bench("analyze_quality.approximate", lambda: analyze_quality(
+        mode="approximate", sample_fraction=args.sample_fraction, workers=args.workers, record_history=False
+    ))
+    bench("analyze_quality.incremental", lambda: analyze_quality(
+        incremental=True, workers=args.workers, record_history=False
+    ))
+
+    try:
+        from fastapi.testclient import TestClient
+        from backend_server import app
+    except Exception as e:
+        print(f"⚠️ Skipping API benchmarks: {e}")
+        return results
+
+    client = TestClient(app)
+
+    def get(path):
+        def call():
+            response = client.get(path)
+            if response.status_code >= 400:
+                raise RuntimeError(f"GET {path} -> {response.status_code}: {response.text[:200]}")
+        return call
+
+    endpoints = [
+        "/",
+        "/health",
+        "/ready",
+        "/tables",
+        "/tables/orders/metadata",
+        "/tables/orders/metadata?count=exact",
+        "/tables/orders/quality",
+        "/tables/orders/quality?max_age=0",
+        "/tables/orders/quality?mode=approximate",
+        "/catalog",
+        "/catalog/changes?since=0",
+        "/tables/orders/history/row-count",
+        "/tables/orders/history/completeness?bucket=day",
+    ]
+
+    analyze_quality(workers=args.workers)  # seed the history store for the history endpoints
+    for path in endpoints:
+        bench(f"GET {path}", get(path), repeat=args.api_repeat)
+
+    return results
+
+
+# -----------------------------
+# BASELINE COMPARISON
+# -----------------------------
+
+def compare(results, baseline, threshold):
+    """Per-benchmark ratio against the baseline median; regressions exceed 1 + threshold"""
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "median_s" not in base or "median_s" not in result or not base["median_s"]:
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        comparison[name] = {
+            "baseline_median_s": base["median_s"],
+            "median_s": result["median_s"],
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold
+        }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataDoc AI performance benchmarks")
+    parser.add_argument("--rows", type=int, default=10_000, help="rows per table (1K - 50M)")
+    parser.add_argument("--columns", type=int, default=10, help="columns per table (10 - 500)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per backend benchmark")
+    parser.add_argument("--api-repeat", type=int, default=20, help="requests per endpoint benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="quality workers")
+    parser.add_argument("--sample-fraction", type=float, default=0.01)
+    parser.add_argument("--postgres", action="store_true", help="benchmark against PostgreSQL (DB_* settings)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="keep the generated database")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="datadoc_bench_")
+    try:
+        results = run_suite(args, work_dir)
+    finally:
+        if args.keep:
+            print(f"📁 Benchmark files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "rows": args.rows,
+            "columns": args.columns,
+            "workers": args.workers,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "postgres": args.postgres
+        },
+        "results": results
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if (baseline["meta"]["rows"], baseline["meta"]["columns"]) != (args.rows, args.columns):
+            print("⚠️ Baseline was recorded with a different dataset size; ratios are not comparable")
+        report["comparison"] = compare(results, baseline, args.threshold)
+        regressions = [name for name, c in report["comparison"].items() if c["regression"]]
+        for name, c in report["comparison"].items():
+            flag = "🔴" if c["regression"] else "🟢"
+            print(f"{flag} {name}: {c['ratio']}x baseline")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"✅ Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"✅ Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s): {regressions}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
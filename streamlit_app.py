@@ -1,4 +1,6 @@
 import os
+import json
+import time
 import requests
 import streamlit as st
 from dotenv import load_dotenv
@@ -8,6 +10,8 @@ load_dotenv()
 
 # Backend API URL
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# Stop waiting on a refresh job after this many seconds (it keeps running on the backend)
+JOB_WAIT_TIMEOUT = float(os.getenv("JOB_WAIT_TIMEOUT", "600"))
 
 # ----------------- UI CONFIG -----------------
 st.set_page_config(
@@ -85,37 +89,90 @@ def generate_table_summary(table_name):
         st.error(f"Error generating summary: {str(e)}")
         return None
 
-def refresh_metadata():
-    """Refresh metadata for all tables"""
+class SummariesDisabled(Exception):
+    """The backend has no GROQ_API_KEY (503 from the streaming endpoint)"""
+
+def stream_table_summary(table_name):
+    """Yield pieces of the AI summary as the backend streams them (server-sent events)"""
+    with requests.post(f"{BACKEND_URL}/tables/{table_name}/summary/stream", stream=True) as response:
+        if response.status_code == 503:
+            raise SummariesDisabled(response.json().get("detail", "AI summaries are disabled."))
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code}: {response.text[:200]}")
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "delta":
+                    yield data["text"]
+                elif event == "error":
+                    raise RuntimeError(data["detail"])
+
+def render_summary_stream(table_name):
+    """Render the summary progressively; returns the full text (None on failure)"""
+    placeholder = st.empty()
+    summary = ""
     try:
-        response = requests.post(f"{BACKEND_URL}/refresh-metadata")
-        if response.status_code == 200:
-            return response.json().get("message", "")
-        else:
-            st.error(f"Failed to refresh metadata: {response.status_code}")
-            return None
+        for piece in stream_table_summary(table_name):
+            summary += piece
+            placeholder.markdown(summary + "▌")
+    except SummariesDisabled as e:
+        # Same notice the non-streaming endpoint returns as its summary
+        notice = f"🤖 {e}"
+        placeholder.info(notice)
+        return notice
     except Exception as e:
-        st.error(f"Error refreshing metadata: {str(e)}")
+        st.error(f"Error generating summary: {str(e)}")
         return None
+    placeholder.markdown(summary)
+    return summary
 
-def refresh_quality():
-    """Refresh quality metrics for all tables"""
+def wait_for_job(job, poll_seconds=1.0, timeout=JOB_WAIT_TIMEOUT):
+    """Poll a background refresh job until it finishes or `timeout` seconds pass; returns the last job dict"""
+    deadline = time.monotonic() + timeout
+    while job.get("status") in ("queued", "running"):
+        if time.monotonic() >= deadline:
+            return dict(job, status="still running",
+                        error=f"gave up waiting after {timeout:g}s; the job continues in the background")
+        time.sleep(poll_seconds)
+        response = requests.get(f"{BACKEND_URL}/jobs/{job['job_id']}", timeout=10)
+        if response.status_code != 200:
+            break
+        job = response.json()
+    return job
+
+def run_refresh(endpoint, label):
+    """Start a refresh job and wait for it to finish"""
     try:
-        response = requests.post(f"{BACKEND_URL}/refresh-quality")
-        if response.status_code == 200:
-            return response.json().get("message", "")
+        response = requests.post(f"{BACKEND_URL}/{endpoint}")
+        if response.status_code in (200, 202):
+            job = wait_for_job(response.json()["job"])
+            if job.get("status") == "succeeded":
+                return f"{label} refreshed successfully"
+            st.error(f"{label} refresh {job.get('status')}: {job.get('error') or ''}")
+            return None
         else:
-            st.error(f"Failed to refresh quality: {response.status_code}")
+            st.error(f"Failed to refresh {label.lower()}: {response.status_code}")
             return None
     except Exception as e:
-        st.error(f"Error refreshing quality: {str(e)}")
+        st.error(f"Error refreshing {label.lower()}: {str(e)}")
         return None
 
+def refresh_metadata():
+    """Refresh metadata for all tables"""
+    return run_refresh("refresh-metadata", "Metadata")
+
+def refresh_quality():
+    """Refresh quality metrics for all tables"""
+    return run_refresh("refresh-quality", "Quality metrics")
+
 def check_backend_health():
-    """Check if backend is healthy"""
+    """Check if backend is healthy (readiness: 503 still carries the database status)"""
     try:
-        response = requests.get(f"{BACKEND_URL}/health")
-        if response.status_code == 200:
+        response = requests.get(f"{BACKEND_URL}/ready")
+        if response.status_code in (200, 503):
             return response.json()
         else:
             return None
@@ -128,9 +185,14 @@ with st.sidebar:
     
     # Check backend health
     health = check_backend_health()
-    if health:
+    if health and health.get("status") == "ready":
         st.success("✅ Backend Connected")
         st.info(f"Database: {health.get('database', 'Unknown')}")
+    elif health:
+        st.warning("⚠️ Backend up, but not ready")
+        st.info(f"Database: {health.get('database', 'Unknown')}")
+        if health.get("error"):
+            st.caption(health["error"])
     else:
         st.error("❌ Backend Disconnected")
         st.info("Make sure backend is running")
@@ -249,11 +311,9 @@ if selected_table:
     # Generate AI summary
     elif st.session_state.get("generate_summary") == selected_table:
         with st.chat_message("assistant"):
-            with st.spinner(f"Generating AI summary for {selected_table}..."):
-                summary = generate_table_summary(selected_table)
-                if summary:
-                    st.write(summary)
-                    st.session_state.messages.append({"role": "assistant", "content": summary})
+            summary = render_summary_stream(selected_table)
+            if summary:
+                st.session_state.messages.append({"role": "assistant", "content": summary})
         
         st.session_state.generate_summary = None
 
@@ -0,0 +1,29 @@
+from backend import quality_history
+
+
+def _record(path, recorded_at, total_rows):
+    quality = {
+        "total_rows": total_rows,
+        "column_completeness": {"id": {"non_null_count": total_rows, "completeness_percent": 100.0}}
+    }
+    quality_history.record_run({"orders": quality}, recorded_at=recorded_at, path=path)
+
+
+def test_prefix_until_includes_whole_bucket(tmp_path):
+    path = str(tmp_path / "history.db")
+    _record(path, "2024-02-01T01:30:00+00:00", 10)
+    _record(path, "2024-02-01T02:00:00+00:00", 20)
+    _record(path, "2024-02-01T02:45:00+00:00", 30)
+    _record(path, "2024-02-01T03:00:00+00:00", 40)
+
+    raw = quality_history.row_count_series("orders", until="2024-02-01T02", path=path)
+    assert [point["total_rows"] for point in raw] == [10, 20, 30]
+
+    hourly = quality_history.row_count_series("orders", until="2024-02-01T02", bucket="hour", path=path)
+    assert [point["total_rows"] for point in hourly] == [10, 25]
+
+    columns = quality_history.completeness_series("orders", until="2024-02-01T02", path=path)
+    assert len(columns["id"]) == 3
+
+    exact = quality_history.row_count_series("orders", until="2024-02-01T02:00:00+00:00", path=path)
+    assert [point["total_rows"] for point in exact] == [10, 20]